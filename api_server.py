@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço HTTP/JSON (sem Tkinter) sobre o Database e o ExportManager, para que várias estações
+e tablets usem o mesmo banco sem abrir o arquivo servicos.db diretamente.
+
+Rotas:
+    GET    /servicos                lista paginada (filtros e paginação na query string)
+    GET    /servicos/<id>           obtém um serviço
+                                    (?incluir_arquivo=1 inclui os arquivados, também na listagem)
+    POST   /servicos                cadastra um serviço
+    PUT    /servicos/<id>           atualiza um serviço (PATCH também é aceito)
+    DELETE /servicos/<id>           exclui um serviço
+    GET    /servicos/<id>/pdf       PDF da ordem de serviço
+    GET    /resumo                  totais do painel
+
+Uso:
+    python api_server.py --host 127.0.0.1 --porta 8765 --banco servicos.db
+"""
+import argparse
+import asyncio
+import json
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qsl
+
+from database import Database, CAMPOS_OBRIGATORIOS, normalizar_data_solicitacao
+from export_manager import ExportManager, COLUNAS_EXPORTACAO
+
+# Campos aceitos no corpo de POST/PUT (os demais são recusados, pois viram nomes de colunas no SQL)
+CAMPOS_GRAVAVEIS = set(COLUNAS_EXPORTACAO) - {'id'}
+
+# Parâmetros da listagem que não são filtros
+PARAMETROS_PAGINACAO = {'itens_por_pagina', 'token', 'ultima'}
+
+TAMANHO_MAXIMO_CORPO = 1024 * 1024
+
+ROTA_SERVICO = re.compile(r'^/servicos/(\d+)(/pdf)?/?$')
+
+
+class ErroRequisicao(Exception):
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+        self.mensagem = mensagem
+
+
+class EscritorAgrupado:
+    """
+    Thread única de escrita: as operações enviadas por escrever() são agrupadas e confirmadas
+    em uma só transação (group commit), evitando que escritas concorrentes disputem o lock do banco.
+    Cada operação roda em um SAVEPOINT (chamada aninhada do pool), então a falha de uma
+    não desfaz as demais do grupo.
+    """
+    def __init__(self, database, max_grupo=64, espera_grupo=0.002):
+        self.database = database
+        self.max_grupo = max_grupo
+        self.espera_grupo = espera_grupo
+        self._fila = queue.Queue()
+        self._thread = threading.Thread(target=self._executar, name='escritor', daemon=True)
+        self._thread.start()
+
+    def escrever(self, funcao, *args):
+        """Agenda funcao(*args) na thread de escrita e retorna um asyncio.Future com o resultado"""
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        self._fila.put((loop, futuro, funcao, args))
+        return futuro
+
+    def encerrar(self):
+        self._fila.put(None)
+        self._thread.join()
+
+    def _proximo_grupo(self):
+        operacao = self._fila.get()
+        if operacao is None:
+            return None
+        grupo = [operacao]
+        while len(grupo) < self.max_grupo:
+            try:
+                operacao = self._fila.get(timeout=self.espera_grupo)
+            except queue.Empty:
+                break
+            if operacao is None:
+                # Grava o grupo atual e encerra na próxima volta
+                self._fila.put(None)
+                break
+            grupo.append(operacao)
+        return grupo
+
+    def _executar(self):
+        while True:
+            grupo = self._proximo_grupo()
+            if grupo is None:
+                return
+            resultados = []
+            try:
+                with self.database.get_connection() as conn:
+                    # Reserva o lock de escrita já no início, em vez de promover a transação no meio do grupo
+                    conn.execute("BEGIN IMMEDIATE")
+                    for _, _, funcao, args in grupo:
+                        try:
+                            resultados.append((funcao(*args), None))
+                        except Exception as e:
+                            resultados.append((None, e))
+            except Exception as e:
+                resultados = [(None, e)] * len(grupo)
+            # Leituras feitas antes do commit podem ter guardado contagens antigas
+            self.database.invalidar_contagens()
+            for (loop, futuro, _, _), (resultado, erro) in zip(grupo, resultados):
+                loop.call_soon_threadsafe(self._resolver, futuro, resultado, erro)
+
+    @staticmethod
+    def _resolver(futuro, resultado, erro):
+        if futuro.cancelled():
+            return
+        if erro is not None:
+            futuro.set_exception(erro)
+        else:
+            futuro.set_result(resultado)
+
+
+class ServidorAPI:
+    """Servidor HTTP/1.1 mínimo sobre asyncio: leituras em um pool de threads, escritas no EscritorAgrupado"""
+    def __init__(self, db_file='servicos.db', host='127.0.0.1', porta=8765, leitores=4):
+        self.host = host
+        self.porta = porta
+        # Uma conexão para cada leitor e uma para o escritor
+        self.database = Database(db_file, max_conexoes=leitores + 1)
+        self.export_manager = ExportManager(self.database)
+        self.escritor = EscritorAgrupado(self.database)
+        self.leitores = ThreadPoolExecutor(max_workers=leitores, thread_name_prefix='leitor')
+        self._servidor = None
+
+    async def iniciar(self):
+        self._servidor = await asyncio.start_server(self._atender_conexao, self.host, self.porta)
+        # Com porta 0 o sistema escolhe uma porta livre
+        self.porta = self._servidor.sockets[0].getsockname()[1]
+        return self._servidor
+
+    async def executar(self):
+        await self.iniciar()
+        print(f"API de serviços em http://{self.host}:{self.porta}")
+        async with self._servidor:
+            await self._servidor.serve_forever()
+
+    def encerrar(self):
+        if self._servidor is not None:
+            self._servidor.close()
+        self.escritor.encerrar()
+        self.leitores.shutdown(wait=True)
+        self.database.fechar()
+
+    async def _ler(self, funcao, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.leitores, lambda: funcao(*args, **kwargs))
+
+    async def _atender_conexao(self, reader, writer):
+        try:
+            while True:
+                linha = await reader.readline()
+                if not linha.strip():
+                    break
+                try:
+                    metodo, alvo, versao = linha.decode('latin-1').split()
+                except ValueError:
+                    await self._responder(writer, HTTPStatus.BAD_REQUEST, {'erro': 'Requisição inválida'}, False)
+                    break
+
+                cabecalhos = {}
+                while True:
+                    linha = await reader.readline()
+                    if linha in (b'\r\n', b'\n', b''):
+                        break
+                    nome, _, valor = linha.decode('latin-1').partition(':')
+                    cabecalhos[nome.strip().lower()] = valor.strip()
+
+                manter = (versao == 'HTTP/1.1' and cabecalhos.get('connection', '').lower() != 'close')
+                try:
+                    tamanho = int(cabecalhos.get('content-length') or 0)
+                except ValueError:
+                    tamanho = -1
+                if tamanho < 0:
+                    # Sem um tamanho confiável não há como saber onde o corpo termina: a conexão é encerrada
+                    await self._responder(writer, HTTPStatus.BAD_REQUEST, {'erro': 'Content-Length inválido'}, False)
+                    break
+                if tamanho > TAMANHO_MAXIMO_CORPO:
+                    await self._responder(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                          {'erro': 'Corpo da requisição muito grande'}, False)
+                    break
+                corpo = await reader.readexactly(tamanho) if tamanho else b''
+
+                try:
+                    status, conteudo = await self._rotear(metodo.upper(), alvo, corpo)
+                except ErroRequisicao as e:
+                    status, conteudo = e.status, {'erro': e.mensagem}
+                except Exception as e:
+                    print(f"Erro ao atender {metodo} {alvo}: {e}")
+                    status, conteudo = HTTPStatus.INTERNAL_SERVER_ERROR, {'erro': str(e)}
+                await self._responder(writer, status, conteudo, manter)
+                if not manter:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _responder(self, writer, status, conteudo, manter):
+        if isinstance(conteudo, bytes):
+            tipo, dados = 'application/pdf', conteudo
+        elif conteudo is None:
+            tipo, dados = None, b''
+        else:
+            tipo, dados = 'application/json; charset=utf-8', json.dumps(conteudo, ensure_ascii=False).encode('utf-8')
+        cabecalhos = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Length: {len(dados)}",
+                      f"Connection: {'keep-alive' if manter else 'close'}"]
+        if tipo:
+            cabecalhos.append(f"Content-Type: {tipo}")
+        writer.write(('\r\n'.join(cabecalhos) + '\r\n\r\n').encode('latin-1') + dados)
+        await writer.drain()
+
+    async def _rotear(self, metodo, alvo, corpo):
+        url = urlsplit(alvo)
+        caminho = url.path
+        if caminho.rstrip('/') == '/servicos':
+            if metodo == 'GET':
+                return await self._listar(dict(parse_qsl(url.query)))
+            if metodo == 'POST':
+                return await self._criar(self._ler_json(corpo))
+            raise ErroRequisicao(HTTPStatus.METHOD_NOT_ALLOWED, 'Método não permitido')
+        if caminho.rstrip('/') == '/resumo' and metodo == 'GET':
+            return HTTPStatus.OK, await self._ler(self.database.obter_resumo)
+
+        rota = ROTA_SERVICO.match(caminho)
+        if not rota:
+            raise ErroRequisicao(HTTPStatus.NOT_FOUND, 'Rota não encontrada')
+        id_servico, pdf = int(rota.group(1)), rota.group(2)
+        if pdf:
+            if metodo != 'GET':
+                raise ErroRequisicao(HTTPStatus.METHOD_NOT_ALLOWED, 'Método não permitido')
+            return await self._pdf(id_servico)
+        if metodo == 'GET':
+            incluir_arquivo = Database.inclui_arquivo(dict(parse_qsl(url.query)))
+            servico = await self._ler(self.database.obter_servico, id_servico, incluir_arquivo=incluir_arquivo)
+            if not servico:
+                raise ErroRequisicao(HTTPStatus.NOT_FOUND, 'Serviço não encontrado')
+            return HTTPStatus.OK, servico
+        if metodo in ('PUT', 'PATCH'):
+            return await self._atualizar(id_servico, self._ler_json(corpo))
+        if metodo == 'DELETE':
+            if not await self.escritor.escrever(self.database.excluir_servico, id_servico):
+                raise ErroRequisicao(HTTPStatus.NOT_FOUND, 'Serviço não encontrado')
+            return HTTPStatus.NO_CONTENT, None
+        raise ErroRequisicao(HTTPStatus.METHOD_NOT_ALLOWED, 'Método não permitido')
+
+    @staticmethod
+    def _ler_json(corpo):
+        try:
+            dados = json.loads(corpo or b'{}')
+        except ValueError:
+            raise ErroRequisicao(HTTPStatus.BAD_REQUEST, 'JSON inválido')
+        if not isinstance(dados, dict):
+            raise ErroRequisicao(HTTPStatus.BAD_REQUEST, 'O corpo deve ser um objeto JSON')
+        desconhecidos = set(dados) - CAMPOS_GRAVAVEIS
+        if desconhecidos:
+            raise ErroRequisicao(HTTPStatus.BAD_REQUEST, f"Campos desconhecidos: {', '.join(sorted(desconhecidos))}")
+        return dados
+
+    def _validar_cpf(self, dados):
+        if dados.get('cpf') and not self.database.validar_cpf(re.sub(r'\D', '', str(dados['cpf']))):
+            raise ErroRequisicao(HTTPStatus.BAD_REQUEST, 'CPF inválido')
+
+    @staticmethod
+    def _validar_data(dados, atualizacao=False):
+        # No cadastro a data vazia vira a data atual; na atualização ela precisa ser válida
+        if 'data_solicitacao' in dados and (atualizacao or dados['data_solicitacao']):
+            try:
+                normalizar_data_solicitacao(dados['data_solicitacao'])
+            except ValueError as e:
+                raise ErroRequisicao(HTTPStatus.BAD_REQUEST, str(e))
+
+    async def _listar(self, parametros):
+        try:
+            itens_por_pagina = max(1, min(int(parametros.get('itens_por_pagina', 20)), 500))
+        except ValueError:
+            raise ErroRequisicao(HTTPStatus.BAD_REQUEST, 'itens_por_pagina inválido')
+        filtros = {campo: valor for campo, valor in parametros.items()
+                   if campo not in PARAMETROS_PAGINACAO and valor}
+        try:
+            servicos, total, token_anterior, token_proximo = await self._ler(
+                self.database.listar_servicos_pagina, filtros=filtros, itens_por_pagina=itens_por_pagina,
+                token=parametros.get('token') or None, ultima=parametros.get('ultima') in ('1', 'true'))
+        except ValueError as e:
+            raise ErroRequisicao(HTTPStatus.BAD_REQUEST, str(e))
+        return HTTPStatus.OK, {'servicos': servicos, 'total': total, 'token_anterior': token_anterior,
+                               'token_proximo': token_proximo}
+
+    async def _criar(self, dados):
+        faltando = [campo for campo in CAMPOS_OBRIGATORIOS if not str(dados.get(campo) or '').strip()]
+        if faltando:
+            raise ErroRequisicao(HTTPStatus.BAD_REQUEST, f"Campos obrigatórios ausentes: {', '.join(faltando)}")
+        self._validar_cpf(dados)
+        self._validar_data(dados)
+        id_servico = await self.escritor.escrever(self.database.inserir_servico, dados)
+        return HTTPStatus.CREATED, {'id': id_servico}
+
+    async def _atualizar(self, id_servico, dados):
+        if not dados:
+            raise ErroRequisicao(HTTPStatus.BAD_REQUEST, 'Nenhum campo para atualizar')
+        vazios = [campo for campo in CAMPOS_OBRIGATORIOS if campo in dados and not str(dados[campo] or '').strip()]
+        if vazios:
+            raise ErroRequisicao(HTTPStatus.BAD_REQUEST, f"Campos obrigatórios vazios: {', '.join(vazios)}")
+        self._validar_cpf(dados)
+        self._validar_data(dados, atualizacao=True)
+        if not await self.escritor.escrever(self.database.atualizar_servico, id_servico, dados):
+            raise ErroRequisicao(HTTPStatus.NOT_FOUND, 'Serviço não encontrado')
+        return HTTPStatus.OK, await self._ler(self.database.obter_servico, id_servico)
+
+    async def _pdf(self, id_servico):
+        def ler_pdf():
+            caminho = self.export_manager.obter_pdf_em_cache(id_servico)
+            if not caminho:
+                return None
+            with open(caminho, 'rb') as arquivo:
+                return arquivo.read()
+
+        conteudo = await self._ler(ler_pdf)
+        if conteudo is None:
+            raise ErroRequisicao(HTTPStatus.NOT_FOUND, 'Serviço não encontrado')
+        return HTTPStatus.OK, conteudo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API HTTP/JSON do Sistema de Cadastro de Serviços")
+    parser.add_argument('--host', default='127.0.0.1', help="Endereço de escuta (padrão: 127.0.0.1)")
+    parser.add_argument('--porta', type=int, default=8765, help="Porta TCP (padrão: 8765)")
+    parser.add_argument('--banco', default='servicos.db', help="Arquivo do banco SQLite")
+    parser.add_argument('--leitores', type=int, default=4, help="Threads de leitura (padrão: 4)")
+    args = parser.parse_args()
+
+    servidor = ServidorAPI(args.banco, host=args.host, porta=args.porta, leitores=args.leitores)
+    try:
+        asyncio.run(servidor.executar())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.encerrar()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Arquivamento dos serviços antigos, para execução agendada (cron, Agendador de Tarefas do Windows).
+Move os serviços concluídos ou cancelados há mais de N dias para o banco de arquivo
+(<banco>_arquivo.db), mantendo a tabela principal pequena.
+
+Uso:
+    python arquivamento.py --dias 365 --banco servicos.db
+"""
+import argparse
+
+from database import Database
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arquivamento dos serviços concluídos e cancelados antigos")
+    parser.add_argument('--dias', type=int, default=365,
+                        help="Idade mínima, em dias desde a conclusão (ou solicitação), dos serviços arquivados "
+                             "(padrão: 365)")
+    parser.add_argument('--banco', default='servicos.db', help="Arquivo do banco SQLite")
+    parser.add_argument('--arquivo', help="Arquivo do banco de arquivo (padrão: <banco>_arquivo.db)")
+    parser.add_argument('--lote', type=int, default=500, help="Serviços movidos por transação (padrão: 500)")
+    args = parser.parse_args()
+
+    database = Database(args.banco, banco_arquivo=args.arquivo)
+    try:
+        arquivados = database.arquivar_servicos(dias=args.dias, tamanho_lote=args.lote)
+        print(f"{arquivados} serviço(s) arquivado(s) em {database.banco_arquivo}")
+    finally:
+        database.fechar()
+
+
+if __name__ == '__main__':
+    main()
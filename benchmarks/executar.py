@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks das operações principais sobre um banco com serviços sintéticos.
+Executar a partir da raiz do projeto:
+
+    python -m benchmarks.executar --linhas 100000 --saida resultado.json
+
+O resultado é um JSON com o tempo (em milissegundos) de cada operação, para comparar versões.
+A execução termina com erro se o tempo por lote da carga crescer além de LIMITE_CRESCIMENTO_CARGA.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from itertools import islice
+
+from database import Database
+from benchmarks.gerador import gerar_servicos, BAIRROS, RUAS
+
+TAMANHO_LOTE_CARGA = 2000
+
+# O tempo de cada lote da carga deve ficar quase constante conforme a tabela cresce: a verificação
+# compara a mediana dos últimos LOTES_COMPARADOS lotes com a dos primeiros e falha acima do limite
+LOTES_COMPARADOS = 2
+LIMITE_CRESCIMENTO_CARGA = 3.0
+
+
+def popular(database, linhas, semente, exibir_progresso=True):
+    """
+    Insere `linhas` serviços gerados com a semente informada
+    Retorna o tempo total e a lista com o tempo de cada lote, em segundos
+    """
+    servicos = gerar_servicos(linhas, semente)
+    inseridos = 0
+    tempos_lotes = []
+    inicio = time.perf_counter()
+    while True:
+        lote = list(islice(servicos, TAMANHO_LOTE_CARGA))
+        if not lote:
+            break
+        inicio_lote = time.perf_counter()
+        ids, erros = database.inserir_servicos_em_lote(lote, tamanho_lote=TAMANHO_LOTE_CARGA)
+        tempos_lotes.append(time.perf_counter() - inicio_lote)
+        if erros:
+            raise RuntimeError(f"Falha ao gerar os dados: {erros[:3]}")
+        inseridos += len(lote)
+        if exibir_progresso:
+            print(f"  {inseridos}/{linhas} serviços gerados", file=sys.stderr)
+    return time.perf_counter() - inicio, tempos_lotes
+
+
+def crescimento_carga(tempos_lotes):
+    """
+    Razão entre a mediana dos últimos lotes completos da carga e a dos primeiros
+    Retorna None se a carga teve lotes de menos para a comparação
+    """
+    completos = tempos_lotes[:-1] if len(tempos_lotes) > 1 else tempos_lotes
+    if len(completos) < 2 * LOTES_COMPARADOS:
+        return None
+    primeiros = statistics.median(completos[:LOTES_COMPARADOS])
+    ultimos = statistics.median(completos[-LOTES_COMPARADOS:])
+    return round(ultimos / primeiros, 3)
+
+
+def medir(funcao, repeticoes, preparar=None):
+    """Executa funcao() `repeticoes` vezes e retorna as estatísticas de tempo em milissegundos"""
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        if resultado is False:
+            return {'falhou': True}
+    return {
+        'repeticoes': repeticoes,
+        'min_ms': round(min(tempos), 3),
+        'mediana_ms': round(statistics.median(tempos), 3),
+        'media_ms': round(statistics.mean(tempos), 3),
+        'max_ms': round(max(tempos), 3),
+    }
+
+
+def _dependencias_ausentes(*modulos):
+    return [modulo for modulo in modulos if importlib.util.find_spec(modulo) is None]
+
+
+def executar_benchmarks(database, pasta_trabalho, repeticoes=5):
+    resultados = {}
+    total = database.contar_servicos()
+    itens = 20
+    ultima_pagina = max(1, (total + itens - 1) // itens)
+
+    # Uma amostra real para as buscas por CPF e por endereço
+    amostra = database.listar_servicos(pagina=max(1, ultima_pagina // 2), itens_por_pagina=1)[0][0]
+    bairro_comum, rua_comum = BAIRROS[0], RUAS[0]
+
+    # As contagens ficam em cache no Database: são descartadas para medir a consulta de fato
+    sem_cache = database.invalidar_contagens
+
+    casos = {
+        'listar_servicos_primeira_pagina': lambda: database.listar_servicos(pagina=1, itens_por_pagina=itens),
+        'listar_servicos_filtrado': lambda: database.listar_servicos(
+            filtros={'bairro': bairro_comum, 'status': 'Pendente'}, pagina=1, itens_por_pagina=itens),
+        'listar_servicos_filtro_nome': lambda: database.listar_servicos(
+            filtros={'nome': amostra['nome'].split()[0]}, pagina=1, itens_por_pagina=itens),
+        'listar_servicos_pagina_intermediaria': lambda: database.listar_servicos(
+            pagina=max(1, ultima_pagina // 2), itens_por_pagina=itens),
+        'listar_servicos_ultima_pagina': lambda: database.listar_servicos(
+            pagina=ultima_pagina, itens_por_pagina=itens),
+        'listar_servicos_pagina_keyset_ultima': lambda: database.listar_servicos_pagina(
+            itens_por_pagina=itens, ultima=True),
+        'listar_servicos_periodo_conclusao': lambda: database.listar_servicos(
+            filtros={'conclusao_de': '01/11/2024', 'conclusao_ate': '30/11/2024'}, pagina=1, itens_por_pagina=itens),
+        'verificar_endereco_duplicado_existente': lambda: database.verificar_endereco_duplicado(
+            amostra['bairro'], amostra['rua'], amostra['numero'], amostra['quadra'], amostra['lote']),
+        'verificar_endereco_duplicado_inexistente': lambda: database.verificar_endereco_duplicado(
+            bairro_comum, rua_comum, '999999'),
+        'buscar_por_cpf': lambda: database.buscar_por_cpf(amostra['cpf']),
+        'buscar_por_cpf_prefixo': lambda: database.buscar_por_cpf(amostra['cpf'][:7]),
+        'obter_resumo': database.obter_resumo,
+    }
+    for nome, funcao in casos.items():
+        resultados[nome] = medir(funcao, repeticoes, preparar=sem_cache)
+
+    # Cada repetição insere um serviço novo, gerado com outra semente para não repetir os dados da carga
+    novos = gerar_servicos(repeticoes, semente=-1)
+    resultados['inserir_servico'] = medir(lambda: database.inserir_servico(next(novos)), repeticoes)
+
+    ausentes = _dependencias_ausentes('pandas', 'reportlab', 'openpyxl')
+    if ausentes:
+        motivo = f"dependências ausentes: {', '.join(ausentes)}"
+        resultados['exportar_excel'] = {'pulado': motivo}
+        resultados['gerar_pdf_sem_cache'] = {'pulado': motivo}
+        resultados['gerar_pdf_em_cache'] = {'pulado': motivo}
+        return resultados
+
+    from export_manager import ExportManager
+    from pdf_cache import CachePDF
+
+    cache_pdf = CachePDF(pasta=os.path.join(pasta_trabalho, 'pdf_cache'))
+    export_manager = ExportManager(database, cache_pdf=cache_pdf)
+    # Exportação de um status (cerca de 10% das linhas), para o tempo continuar viável com milhões de linhas
+    caminho_excel = os.path.join(pasta_trabalho, 'exportacao.xlsx')
+    resultados['exportar_excel'] = medir(
+        lambda: export_manager.exportar_excel(caminho_excel, filtros={'status': 'Cancelado'}, streaming=True), 1)
+    caminho_pdf = os.path.join(pasta_trabalho, 'servico.pdf')
+    resultados['gerar_pdf_sem_cache'] = medir(lambda: export_manager.gerar_pdf(amostra['id'], caminho_pdf),
+                                              repeticoes, preparar=cache_pdf.limpar)
+    resultados['gerar_pdf_em_cache'] = medir(lambda: export_manager.gerar_pdf(amostra['id'], caminho_pdf),
+                                             repeticoes)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do Sistema de Cadastro de Serviços")
+    parser.add_argument('--linhas', type=int, default=10000, help="Quantidade de serviços gerados (padrão: 10000)")
+    parser.add_argument('--semente', type=int, default=42, help="Semente do gerador (padrão: 42)")
+    parser.add_argument('--repeticoes', type=int, default=5, help="Repetições de cada medição (padrão: 5)")
+    parser.add_argument('--banco', help="Arquivo do banco de benchmark (padrão: pasta temporária)")
+    parser.add_argument('--reutilizar', action='store_true',
+                        help="Reaproveita o banco informado em --banco se ele já tiver a quantidade de linhas pedida")
+    parser.add_argument('--rotulo', default='', help="Identificação da versão medida, gravada no resultado")
+    parser.add_argument('--saida', help="Arquivo JSON de saída (padrão: saída padrão)")
+    args = parser.parse_args()
+
+    pasta_trabalho = tempfile.mkdtemp(prefix='crud_services_bench_')
+    caminho_banco = args.banco or os.path.join(pasta_trabalho, 'benchmark.db')
+    try:
+        if os.path.exists(caminho_banco) and not args.reutilizar:
+            raise SystemExit(f"O banco {caminho_banco} já existe; use --reutilizar ou informe outro arquivo")
+
+        database = Database(caminho_banco)
+        tempo_carga = crescimento = None
+        linhas_existentes = database.contar_servicos()
+        if linhas_existentes == 0:
+            print(f"Gerando {args.linhas} serviços (semente {args.semente})...", file=sys.stderr)
+            tempo_carga, tempos_lotes = popular(database, args.linhas, args.semente)
+            tempo_carga = round(tempo_carga, 3)
+            crescimento = crescimento_carga(tempos_lotes)
+        elif linhas_existentes != args.linhas:
+            raise SystemExit(f"O banco tem {linhas_existentes} serviços, diferente de --linhas {args.linhas}")
+
+        print("Executando benchmarks...", file=sys.stderr)
+        resultado = {
+            'rotulo': args.rotulo,
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'plataforma': platform.platform(),
+            'linhas': args.linhas,
+            'semente': args.semente,
+            'carga_segundos': tempo_carga,
+            'carga_crescimento': crescimento,
+            'resultados': executar_benchmarks(database, pasta_trabalho, args.repeticoes),
+        }
+        database.fechar()
+    finally:
+        shutil.rmtree(pasta_trabalho, ignore_errors=True)
+
+    saida = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(saida + '\n')
+    else:
+        print(saida)
+
+    if crescimento is not None and crescimento > LIMITE_CRESCIMENTO_CARGA:
+        raise SystemExit(f"A carga ficou {crescimento}x mais lenta por lote entre o início e o fim "
+                         f"(limite: {LIMITE_CRESCIMENTO_CARGA}x): a gravação em lote não escala com o tamanho da tabela")
+
+
+if __name__ == '__main__':
+    main()
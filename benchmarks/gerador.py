@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Gerador determinístico de serviços sintéticos para os benchmarks.
+A mesma semente gera sempre as mesmas linhas, em qualquer máquina.
+"""
+import random
+from datetime import datetime, timedelta
+
+from validate_docbr import CPF
+
+# Data de referência fixa: as datas geradas não dependem do dia em que o benchmark roda
+DATA_REFERENCIA = datetime(2025, 1, 1, 8, 0, 0)
+PERIODO_DIAS = 3 * 365
+
+# Bairros e ruas frequentes em cidades brasileiras; os primeiros da lista são os mais comuns (Zipf)
+BAIRROS = [
+    'Centro', 'Jardim América', 'Vila Nova', 'São José', 'Santa Cruz', 'Boa Vista', 'Planalto',
+    'Santo Antônio', 'Industrial', 'Jardim Primavera', 'Vila Operária', 'Cidade Nova', 'Bela Vista',
+    'São Francisco', 'Nossa Senhora Aparecida', 'Jardim das Flores', 'Parque dos Estados', 'Morada do Sol',
+    'Vila Esperança', 'Residencial Ipê', 'Conjunto Habitacional', 'Jardim Europa', 'Alto da Serra',
+    'Santa Luzia', 'Vila Rica', 'Parque Industrial', 'Jardim Paraíso', 'Cohab', 'Bairro dos Pioneiros',
+    'Distrito Rural',
+]
+RUAS = [
+    'Rua São Paulo', 'Rua Sete de Setembro', 'Avenida Brasil', 'Rua das Flores', 'Rua XV de Novembro',
+    'Rua Tiradentes', 'Avenida Getúlio Vargas', 'Rua Santos Dumont', 'Rua Rio de Janeiro', 'Rua Bahia',
+    'Rua Minas Gerais', 'Rua Dom Pedro II', 'Avenida Paraná', 'Rua Marechal Deodoro', 'Rua Duque de Caxias',
+    'Rua Rui Barbosa', 'Travessa da Paz', 'Rua José Bonifácio', 'Rua Castro Alves', 'Alameda dos Ipês',
+    'Rua Pernambuco', 'Rua Goiás', 'Avenida Independência', 'Rua das Palmeiras', 'Rua Barão do Rio Branco',
+    'Rua Floriano Peixoto', 'Rua Amazonas', 'Rua Ceará', 'Rua Santa Catarina', 'Estrada Municipal',
+]
+NOMES = ['Maria', 'José', 'Ana', 'João', 'Antônio', 'Francisca', 'Carlos', 'Paulo', 'Adriana', 'Lucas',
+         'Juliana', 'Marcos', 'Patrícia', 'Pedro', 'Aline', 'Rafael', 'Sandra', 'Luiz', 'Camila', 'Fernanda']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Rodrigues', 'Ferreira', 'Alves', 'Pereira', 'Lima',
+              'Gomes', 'Costa', 'Ribeiro', 'Martins', 'Carvalho', 'Almeida', 'Lopes', 'Soares', 'Fernandes']
+STATUS = [('Concluído', 60), ('Pendente', 30), ('Cancelado', 10)]
+PLACAS = ['ABC1D23', 'FOS2E45', 'VAC3F67', 'LMP4G89', 'QRT5H01']
+MOTORISTAS = ['Joaquim', 'Sebastião', 'Raimundo', 'Valdir']
+AJUDANTES = ['Cícero', 'Edson', 'Gilberto', 'Reginaldo', 'Wagner']
+
+
+def _pesos_zipf(quantidade):
+    return [1 / posicao for posicao in range(1, quantidade + 1)]
+
+
+PESOS_BAIRROS = _pesos_zipf(len(BAIRROS))
+PESOS_RUAS = _pesos_zipf(len(RUAS))
+
+
+def gerar_cpf(aleatorio):
+    """Gera os 11 dígitos de um CPF válido (dígitos verificadores calculados) a partir do gerador informado"""
+    digitos = [aleatorio.randint(0, 9) for _ in range(9)]
+    for tamanho in (9, 10):
+        soma = sum(digito * peso for digito, peso in zip(digitos, range(tamanho + 1, 1, -1)))
+        resto = soma * 10 % 11
+        digitos.append(0 if resto == 10 else resto)
+    return ''.join(map(str, digitos))
+
+
+def gerar_servicos(quantidade, semente=42):
+    """
+    Gera `quantidade` dicionários de serviço prontos para Database.inserir_servicos_em_lote
+    Cada linha depende apenas da semente e da sua posição, então pode ser consumida aos poucos
+    """
+    aleatorio = random.Random(semente)
+    validador = CPF()
+    status_possiveis = [status for status, _ in STATUS]
+    pesos_status = [peso for _, peso in STATUS]
+    # Parte dos clientes tem mais de um serviço (mesmo CPF)
+    clientes = []
+
+    for _ in range(quantidade):
+        if clientes and aleatorio.random() < 0.2:
+            cpf, nome, telefone = aleatorio.choice(clientes)
+        else:
+            cpf = gerar_cpf(aleatorio)
+            # Sequências repetidas (111.111.111-11...) são recusadas pelo validate_docbr
+            while not validador.validate(cpf):
+                cpf = gerar_cpf(aleatorio)
+            nome = f"{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)} {aleatorio.choice(SOBRENOMES)}"
+            telefone = f"(44) 9{aleatorio.randint(8000, 9999)}-{aleatorio.randint(0, 9999):04d}"
+            if len(clientes) < 50000:
+                clientes.append((cpf, nome, telefone))
+
+        solicitacao = DATA_REFERENCIA - timedelta(seconds=aleatorio.randint(0, PERIODO_DIAS * 86400))
+        status = aleatorio.choices(status_possiveis, pesos_status)[0]
+        servico = {
+            'data_solicitacao': solicitacao.strftime('%Y-%m-%d %H:%M:%S'),
+            'cpf': cpf,
+            'nome': nome,
+            'telefone': telefone,
+            'bairro': aleatorio.choices(BAIRROS, PESOS_BAIRROS)[0],
+            'rua': aleatorio.choices(RUAS, PESOS_RUAS)[0],
+            'numero': str(aleatorio.randint(1, 3000)),
+            'quadra': str(aleatorio.randint(1, 60)) if aleatorio.random() < 0.3 else None,
+            'lote': str(aleatorio.randint(1, 40)) if aleatorio.random() < 0.3 else None,
+            'numero_fossas': aleatorio.randint(1, 3),
+            'status': status,
+            'data_chegada': None,
+            'data_saida': None,
+            'data_conclusao': None,
+            'placa_veiculo': None,
+            'motorista': None,
+            'ajudante': None,
+        }
+        if status == 'Concluído':
+            conclusao = solicitacao + timedelta(days=aleatorio.randint(0, 20))
+            servico.update({
+                'data_chegada': f"{aleatorio.randint(7, 15):02d}:{aleatorio.randint(0, 59):02d}",
+                'data_saida': f"{aleatorio.randint(15, 18):02d}:{aleatorio.randint(0, 59):02d}",
+                'data_conclusao': conclusao.strftime('%d/%m/%Y'),
+                'placa_veiculo': aleatorio.choice(PLACAS),
+                'motorista': aleatorio.choice(MOTORISTAS),
+                'ajudante': aleatorio.choice(AJUDANTES),
+            })
+        yield servico
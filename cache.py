@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+from collections import OrderedDict
+
+
+class CacheLRU:
+    """
+    Cache em memória com remoção do item usado há mais tempo (LRU), limite de itens
+    e tempo de vida (TTL) por item. Seguro para uso a partir de várias threads.
+    """
+    def __init__(self, max_itens=256, ttl=30.0):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.expirados = 0
+        self.removidos = 0
+
+    def get(self, chave):
+        """Retorna (True, valor) se a chave estiver no cache e dentro do TTL, senão (False, None)"""
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self.falhas += 1
+                return False, None
+            valor, validade = item
+            if validade < time.monotonic():
+                del self._itens[chave]
+                self.expirados += 1
+                self.falhas += 1
+                return False, None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return True, valor
+
+    def set(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = (valor, time.monotonic() + self.ttl)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+                self.removidos += 1
+
+    def remover(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def remover_se(self, condicao):
+        """Remove os itens cujas chaves atendem à condição"""
+        with self._lock:
+            for chave in [chave for chave in self._itens if condicao(chave)]:
+                del self._itens[chave]
+
+    def clear(self):
+        with self._lock:
+            self._itens.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                'itens': len(self._itens), 'max_itens': self.max_itens, 'ttl': self.ttl,
+                'acertos': self.acertos, 'falhas': self.falhas, 'expirados': self.expirados,
+                'removidos': self.removidos,
+                'taxa_acerto': self.acertos / consultas if consultas else 0.0,
+            }
+
+
+class CacheConsultas:
+    """
+    Camada de cache em torno do Database para as leituras da tela: listagens, páginas,
+    contagens e serviços individuais.
+    As chaves de listagens e contagens incluem a versão de escrita do banco, incrementada a cada
+    inserção, atualização ou exclusão; os serviços individuais são invalidados apenas pelo próprio ID
+    (ou todos de uma vez, quando um lote é arquivado).
+    Os demais atributos são repassados ao Database.
+    """
+    def __init__(self, database, max_itens=256, ttl=30.0):
+        self.database = database
+        self._cache = CacheLRU(max_itens=max_itens, ttl=ttl)
+        self.database.registrar_ouvinte(self._ao_escrever)
+
+    def __getattr__(self, nome):
+        return getattr(self.database, nome)
+
+    @staticmethod
+    def _congelar(filtros):
+        return tuple(sorted((filtros or {}).items()))
+
+    def _consultar(self, chave, funcao, *args, **kwargs):
+        encontrado, valor = self._cache.get(chave)
+        if encontrado:
+            return valor
+        versao = self.database.versao_escrita
+        valor = funcao(*args, **kwargs)
+        # Se houve escrita durante a consulta, o resultado pode já estar desatualizado
+        if self.database.versao_escrita == versao:
+            self._cache.set(chave, valor)
+        return valor
+
+    def _ao_escrever(self, operacao, id_servico):
+        versao = self.database.versao_escrita
+        # Listagens com versões anteriores nunca mais serão lidas
+        self._cache.remover_se(lambda chave: chave[0] != 'servico' and chave[1] != versao)
+        if operacao == 'arquivar':
+            # Os serviços arquivados deixam de ser encontrados sem incluir o arquivo
+            self._cache.remover_se(lambda chave: chave[0] == 'servico')
+        elif id_servico is not None:
+            self._cache.remover(('servico', int(id_servico), False))
+            self._cache.remover(('servico', int(id_servico), True))
+
+    def listar_servicos(self, filtros=None, ordem="data_solicitacao DESC", pagina=1, itens_por_pagina=None):
+        chave = ('listar', self.database.versao_escrita, self._congelar(filtros), ordem, pagina, itens_por_pagina)
+        return self._consultar(chave, self.database.listar_servicos, filtros=filtros, ordem=ordem, pagina=pagina,
+                               itens_por_pagina=itens_por_pagina)
+
+    def listar_servicos_pagina(self, filtros=None, itens_por_pagina=20, token=None, ultima=False):
+        chave = ('pagina', self.database.versao_escrita, self._congelar(filtros), itens_por_pagina, token, ultima)
+        return self._consultar(chave, self.database.listar_servicos_pagina, filtros=filtros,
+                               itens_por_pagina=itens_por_pagina, token=token, ultima=ultima)
+
+    def contar_servicos(self, filtros=None):
+        chave = ('contar', self.database.versao_escrita, self._congelar(filtros))
+        return self._consultar(chave, self.database.contar_servicos, filtros)
+
+    def obter_servico(self, id_servico, incluir_arquivo=False):
+        return self._consultar(('servico', int(id_servico), bool(incluir_arquivo)), self.database.obter_servico,
+                               id_servico, incluir_arquivo=incluir_arquivo)
+
+    def limpar(self):
+        self._cache.clear()
+
+    def estatisticas(self):
+        return self._cache.estatisticas()
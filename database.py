@@ -1,31 +1,329 @@
 # -*- coding: utf-8 -*-
 import sqlite3
 import os
-from datetime import datetime
+import threading
+import queue
+import json
+import base64
+import unicodedata
+from datetime import datetime, timedelta
 from validate_docbr import CPF
 import re
+from instrumentacao import ConexaoInstrumentada
+
+# Colunas de texto indexadas na tabela de busca textual servicos_fts
+CAMPOS_TEXTO = ['nome', 'cpf', 'telefone', 'bairro', 'rua']
+
+# Colunas que não podem ficar vazias em um serviço
+CAMPOS_OBRIGATORIOS = ['cpf', 'nome', 'telefone', 'bairro', 'rua', 'numero']
+
+# Colunas que compõem a chave normalizada do endereço (endereco_chave)
+CAMPOS_ENDERECO = {'bairro', 'rua', 'numero', 'quadra', 'lote'}
+
+# Colunas lidas nas consultas de serviços: a data de solicitação já vem formatada para exibição
+COLUNAS_SERVICO = "*, strftime('%d/%m/%Y', data_solicitacao) AS data_solicitacao_fmt"
+
+# Colunas derivadas mantidas por triggers em SQL puro, para valerem também quando outro programa grava
+# no banco: coluna de origem e expressão do valor, com {r} = new ou servicos
+COLUNAS_DERIVADAS = {
+    'cpf_digitos': ('cpf', "CAST(NULLIF(replace(replace(replace({r}.cpf, '.', ''), '-', ''), ' ', ''), '') AS INTEGER)"),
+    'data_conclusao_iso': ('data_conclusao', """(
+        SELECT CASE WHEN date(v, '+0 days') = v THEN v END FROM (SELECT CASE
+            WHEN t GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*' THEN substr(t, 1, 10)
+            WHEN b1 IN (2, 3) AND b2 IN (2, 3) AND substr(t, b1 + b2 + 1, 4) GLOB '[0-9][0-9][0-9][0-9]'
+                    AND substr(t, 1, b1 - 1) || substr(t, b1 + 1, b2 - 1) NOT GLOB '*[^0-9]*'
+                THEN substr(t, b1 + b2 + 1, 4) || '-' || printf('%02d', substr(t, b1 + 1, b2 - 1))
+                     || '-' || printf('%02d', substr(t, 1, b1 - 1))
+        END AS v FROM (SELECT t, instr(t, '/') AS b1, instr(substr(t, instr(t, '/') + 1), '/') AS b2
+                       FROM (SELECT trim({r}.data_conclusao) AS t))))"""),
+}
+
+# Dimensões da tabela resumo_servicos: expressão do valor agrupado, com {r} = new, old ou servicos
+# Linhas com valor nulo não são contadas (ex.: serviços ainda não concluídos ou sem veículo)
+# O mês de conclusão sai de data_conclusao, e não da coluna derivada, para não depender da ordem dos triggers
+DIMENSOES_RESUMO = {
+    'status': "{r}.status",
+    'bairro': "NULLIF(trim({r}.bairro), '')",
+    'mes': "substr({r}.data_solicitacao, 1, 7)",
+    'mes_conclusao': f"substr({COLUNAS_DERIVADAS['data_conclusao_iso'][1]}, 1, 7)",
+    'veiculo': "NULLIF(upper(trim({r}.placa_veiculo)), '')",
+}
+
+# Filtros de período (datas em DD/MM/AAAA ou AAAA-MM-DD, limites inclusivos)
+FILTROS_DATA = {
+    'solicitacao_de': ('data_solicitacao', '>='),
+    'solicitacao_ate': ('data_solicitacao', '<'),
+    'conclusao_de': ('data_conclusao_iso', '>='),
+    'conclusao_ate': ('data_conclusao_iso', '<='),
+}
+
+# Status dos serviços que podem ir para o banco de arquivo
+STATUS_ARQUIVAVEIS = ('Concluído', 'Cancelado')
+
+
+# Letras acentuadas do português, trocadas pela letra sem acento no índice de busca textual
+# (cada uma é um replace() aninhado, e o analisador do SQLite limita o aninhamento)
+ACENTOS = {'a': 'áàâãÁÀÂÃ', 'e': 'éêÉÊ', 'i': 'íÍ', 'o': 'óôõÓÔÕ', 'u': 'úüÚÜ', 'c': 'çÇ'}
+
+
+def sql_sem_acentos(expressao):
+    """
+    Envolve a expressão SQL em replace() que removem os acentos (ACENTOS), sem depender de funções
+    registradas pelo Python: triggers que as usassem falhariam em conexões de fora do sistema
+    """
+    for letra, acentuadas in ACENTOS.items():
+        for acentuada in acentuadas:
+            expressao = f"replace({expressao}, '{acentuada}', '{letra}')"
+    return expressao
+
+
+def normalizar_texto(valor):
+    """Remove acentos, converte para minúsculas e colapsa espaços, para buscas sem acentuação"""
+    if valor is None:
+        return None
+    texto = unicodedata.normalize('NFKD', str(valor))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.lower().split())
+
+
+# Abreviações comuns em endereços, expandidas antes de comparar
+ABREVIACOES_ENDERECO = {
+    'r': 'rua', 'av': 'avenida', 'avn': 'avenida', 'tv': 'travessa', 'trav': 'travessa', 'al': 'alameda',
+    'pc': 'praca', 'pca': 'praca', 'rod': 'rodovia', 'est': 'estrada', 'estr': 'estrada',
+    'jd': 'jardim', 'jrd': 'jardim', 'vl': 'vila', 'pq': 'parque', 'res': 'residencial', 'cj': 'conjunto',
+    'conj': 'conjunto', 'lgo': 'largo', 'bc': 'beco', 'q': 'quadra', 'qd': 'quadra', 'lt': 'lote',
+    'n': '', 'no': '', 'num': '', 'sta': 'santa', 'sto': 'santo', 'dr': 'doutor',
+    'prof': 'professor', 'gov': 'governador', 'pres': 'presidente', 'cel': 'coronel',
+}
+
+
+def normalizar_parte_endereco(valor):
+    """Normaliza uma parte do endereço: sem acentos, pontuação ou abreviações"""
+    texto = normalizar_texto(valor) or ''
+    texto = re.sub(r'[^0-9a-z]+', ' ', texto)
+    palavras = [ABREVIACOES_ENDERECO.get(palavra, palavra) for palavra in texto.split()]
+    return ' '.join(palavra for palavra in palavras if palavra)
+
+
+def data_iso(valor):
+    """
+    Converte uma data em DD/MM/AAAA ou AAAA-MM-DD (com ou sem hora) para AAAA-MM-DD
+    Retorna None se o valor estiver vazio ou não for uma data válida
+    """
+    texto = str(valor or '').strip()[:10]
+    for formato in ('%d/%m/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(texto, formato).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+
+# Formatos aceitos para a data de solicitação em texto; no banco ela é gravada em AAAA-MM-DD HH:MM:SS
+FORMATOS_DATA_SOLICITACAO = ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y', '%Y-%m-%d %H:%M:%S',
+                             '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+
+def normalizar_data_solicitacao(valor):
+    """
+    Converte a data de solicitação (datetime ou texto em um dos FORMATOS_DATA_SOLICITACAO) para
+    AAAA-MM-DD HH:MM:SS, o formato usado na ordenação e nos filtros por período
+    Lança ValueError se o valor não for uma data reconhecida
+    """
+    if isinstance(valor, datetime):
+        return valor.strftime('%Y-%m-%d %H:%M:%S')
+    texto = str(valor or '').strip()
+    for formato in FORMATOS_DATA_SOLICITACAO:
+        try:
+            return datetime.strptime(texto, formato).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            continue
+    raise ValueError(f"Data de solicitação inválida: {valor}")
+
+
+def chave_endereco(bairro, rua, numero, quadra=None, lote=None):
+    """
+    Gera a chave normalizada do endereço usada na verificação de duplicidade
+    Valores nulos e vazios resultam na mesma chave
+    """
+    return '|'.join(normalizar_parte_endereco(parte) for parte in (bairro, rua, numero, quadra, lote))
+
+
+def _somar_resumo(registro):
+    """Comandos que somam o serviço `registro` (new ou old) aos totais de resumo_servicos"""
+    return '\n'.join(f'''
+    INSERT INTO resumo_servicos (dimensao, valor, total)
+    SELECT '{dimensao}', valor, 1 FROM (SELECT {expressao.format(r=registro)} AS valor) WHERE valor IS NOT NULL
+    ON CONFLICT (dimensao, valor) DO UPDATE SET total = total + 1;'''
+                     for dimensao, expressao in DIMENSOES_RESUMO.items())
+
+
+def _subtrair_resumo(registro):
+    """Comandos que descontam o serviço `registro` (new ou old) dos totais de resumo_servicos"""
+    return '\n'.join(f'''
+    UPDATE resumo_servicos SET total = total - 1
+    WHERE dimensao = '{dimensao}' AND valor = {expressao.format(r=registro)};'''
+                     for dimensao, expressao in DIMENSOES_RESUMO.items())
+
+
+class ConflitoAtualizacao(Exception):
+    """O serviço foi alterado por outra gravação depois de ser lido para edição"""
+
 
 class Database:
-    def __init__(self, db_file='servicos.db'):
+    # Migrações do esquema, aplicadas em ordem e uma única vez por banco (PRAGMA user_version guarda a última)
+    # Cada uma roda em sua própria transação. Alterações novas entram sempre no fim da lista, com a versão seguinte;
+    # as existentes não devem ser modificadas. Bancos criados antes do controle de versão estão na versão 0,
+    # por isso as primeiras migrações toleram objetos que já existam.
+    MIGRACOES = [
+        (1, "Tabela servicos", 'create_tables'),
+        (2, "Colunas derivadas (cpf_digitos, endereco_chave, data_conclusao_iso)", 'migrar_colunas'),
+        (3, "Índices", 'create_indexes'),
+        (4, "Busca textual (servicos_fts)", 'create_fts'),
+        (5, "Resumos (resumo_servicos)", 'create_resumo'),
+        (6, "Colunas derivadas mantidas por triggers", 'create_colunas_derivadas'),
+        (7, "Remoção dos índices substituídos por idx_cpf_digitos e idx_endereco_chave", 'remover_indices_antigos'),
+    ]
+    # Última migração necessária para ler e gravar serviços; as seguintes podem ser adiadas
+    VERSAO_ESSENCIAL = 2
+    # Conjuntos de filtros com a contagem guardada em cache; os mais antigos são descartados
+    MAX_CONTAGENS = 256
+
+    def __init__(self, db_file='servicos.db', max_conexoes=5, cache_size=-20000, mmap_size=268435456,
+                 busy_timeout=5000, inicializacao_adiada=False, banco_arquivo=None):
+        """
+        Com inicializacao_adiada=True, apenas a tabela e as colunas são garantidas aqui; índices,
+        busca textual, resumos e estatísticas do planejador ficam para concluir_inicializacao(),
+        que pode rodar em segundo plano depois que a janela estiver na tela
+        banco_arquivo é o arquivo SQLite que recebe os serviços arquivados (padrão: <banco>_arquivo.db,
+        na mesma pasta), anexado a cada conexão como o esquema `arquivo`
+        """
         # Garantir que o diretório existe
         os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
 
         self.db_file = db_file
+        self.banco_arquivo = banco_arquivo or f"{os.path.splitext(db_file)[0]}_arquivo.db"
         self.cpf_validator = CPF()
+        self.pool = ConnectionPool(db_file, max_conexoes=max_conexoes, cache_size=cache_size,
+                                   mmap_size=mmap_size, busy_timeout=busy_timeout, banco_arquivo=self.banco_arquivo)
+        self._contagens = {}
+        self._geracao_contagens = 0
+        self._lock_contagens = threading.Lock()
+        self._ouvintes = []
+        self.versao_escrita = 0
+        self.fts_disponivel = False
+        self._inicializacao_concluida = False
+        self._lock_inicializacao = threading.Lock()
+        self.migracoes_aplicadas = []
+        self._arquivo_preparado = False
+        self._lock_arquivo = threading.Lock()
 
         # Inicializar o banco de dados
+        self.aplicar_migracoes(ate=self.VERSAO_ESSENCIAL)
+        if not inicializacao_adiada:
+            self.concluir_inicializacao()
+
+    def concluir_inicializacao(self):
+        """Aplica as migrações restantes e atualiza as estatísticas do planejador, se ainda não tiver sido feito"""
+        with self._lock_inicializacao:
+            if self._inicializacao_concluida:
+                return
+            self.aplicar_migracoes()
+            if not self._existe_tabela('servicos_fts'):
+                # A migração 4 é registrada mesmo sem FTS5 no SQLite; a busca textual é tentada
+                # de novo a cada abertura, até que o SQLite instalado a ofereça
+                with self.get_connection() as conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    self.create_fts(conn)
+            # Só depois do commit, para que as outras conexões já enxerguem a tabela servicos_fts
+            self.fts_disponivel = self._existe_tabela('servicos_fts')
+            # Estatísticas completas quando o esquema mudou; nos demais casos o PRAGMA optimize decide
+            self.atualizar_estatisticas(completo=bool(self.migracoes_aplicadas))
+            self._inicializacao_concluida = True
+
+    def versao_esquema(self):
+        """Retorna a versão do esquema gravada no banco (PRAGMA user_version)"""
+        with self.get_connection() as conn:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def aplicar_migracoes(self, ate=None):
+        """
+        Aplica, em ordem, as migrações com versão acima da gravada no banco e até `ate` (todas, se None)
+        Com o banco atualizado nenhum comando de esquema é executado
+        Retorna a lista de versões aplicadas
+        """
+        ate = ate or self.MIGRACOES[-1][0]
+        versao_atual = self.versao_esquema()
+        aplicadas = []
+        for versao, descricao, metodo in self.MIGRACOES:
+            if versao <= versao_atual or versao > ate:
+                continue
+            with self.get_connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                # Outro processo pode ter aplicado a migração enquanto esperávamos o lock de escrita
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= versao:
+                    continue
+                getattr(self, metodo)(conn)
+                conn.execute(f"PRAGMA user_version = {int(versao)}")
+            aplicadas.append(versao)
+        self.migracoes_aplicadas.extend(aplicadas)
+        return aplicadas
+
+    def atualizar_estatisticas(self, completo=False):
+        """
+        Atualiza as estatísticas usadas pelo planejador de consultas (sqlite_stat1)
+        Roda ANALYZE (com amostragem limitada) se completo=True ou se ainda não houver estatísticas;
+        caso contrário roda PRAGMA optimize, que só reanalisa o que for necessário
+        """
+        try:
+            with self.get_connection() as conn:
+                conn.execute("PRAGMA analysis_limit = 1000")
+                if completo or not self._existe_tabela('sqlite_stat1'):
+                    conn.execute("ANALYZE")
+                else:
+                    conn.execute("PRAGMA optimize")
+        except sqlite3.Error as e:
+            print(f"Erro ao atualizar as estatísticas do banco: {e}")
+
+    def _existe_tabela(self, nome):
         with self.get_connection() as conn:
-            self.create_tables(conn)
-            self.create_indexes(conn)
+            return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (nome,)).fetchone() is not None
 
     def get_connection(self):
         """
         Retorna uma conexão com o banco de dados usando context manager
         """
-        return DatabaseConnection(self.db_file)
+        return DatabaseConnection(self.pool)
+
+    def registrar_ouvinte(self, ouvinte):
+        """
+        Registra uma função chamada após cada escrita como ouvinte(operacao, id_servico),
+        com operacao 'inserir', 'atualizar', 'excluir' ou 'arquivar' (esta com id_servico None,
+        uma vez por lote de serviços movidos para o banco de arquivo)
+        Antes de notificar, a versao_escrita do banco é incrementada
+        """
+        self._ouvintes.append(ouvinte)
+
+    def invalidar_contagens(self):
+        """Descarta as contagens em cache (usado também após confirmar transações feitas por fora)"""
+        with self._lock_contagens:
+            self._geracao_contagens += 1
+            self._contagens.clear()
+
+    def _notificar_escrita(self, operacao, id_servico):
+        self.versao_escrita += 1
+        self.invalidar_contagens()
+        for ouvinte in self._ouvintes:
+            ouvinte(operacao, id_servico)
+
+    def fechar(self):
+        """Fecha todas as conexões mantidas pelo pool"""
+        if self._inicializacao_concluida:
+            self.atualizar_estatisticas()
+        self.pool.fechar()
 
     def create_tables(self, conn):
-        """Cria as tabelas necessárias se não existirem"""
+        """Migração 1: cria a tabela servicos"""
         cursor = conn.cursor()
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS servicos (
@@ -49,19 +347,204 @@ class Database:
             placa_veiculo TEXT,
             motorista TEXT,
             ajudante TEXT,
-            observacao_empresa TEXT
+            observacao_empresa TEXT,
+            cpf_digitos INTEGER,
+            endereco_chave TEXT,
+            data_conclusao_iso TEXT
         )
         ''')
-        conn.commit()
+
+    def migrar_colunas(self, conn):
+        """Migração 2: adiciona as colunas derivadas que faltam em bancos criados por versões anteriores"""
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA table_info(servicos)")
+        colunas = {row['name'] for row in cursor.fetchall()}
+
+        if 'cpf_digitos' not in colunas:
+            cursor.execute("ALTER TABLE servicos ADD COLUMN cpf_digitos INTEGER")
+            cursor.execute('''
+            UPDATE servicos SET cpf_digitos = CAST(replace(replace(replace(cpf, '.', ''), '-', ''), ' ', '') AS INTEGER)
+            ''')
+
+        if 'endereco_chave' not in colunas:
+            cursor.execute("ALTER TABLE servicos ADD COLUMN endereco_chave TEXT")
+            cursor.execute("UPDATE servicos SET endereco_chave = chave_endereco(bairro, rua, numero, quadra, lote)")
+
+        if 'data_conclusao_iso' not in colunas:
+            cursor.execute("ALTER TABLE servicos ADD COLUMN data_conclusao_iso TEXT")
+            cursor.execute("UPDATE servicos SET data_conclusao_iso = data_iso(data_conclusao)")
 
     def create_indexes(self, conn):
-        """Cria índices para melhorar a performance das consultas frequentes"""
+        """Migração 3: cria índices para melhorar a performance das consultas frequentes"""
         cursor = conn.cursor()
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_cpf ON servicos (cpf)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_cpf_digitos ON servicos (cpf_digitos)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_endereco ON servicos (bairro, rua, numero, quadra, lote)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_endereco_chave ON servicos (endereco_chave)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_status ON servicos (status)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_data ON servicos (data_solicitacao)')
-        conn.commit()
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_data_conclusao ON servicos (data_conclusao_iso)')
+
+    def create_fts(self, conn):
+        """
+        Migração 4: cria o índice de busca textual (FTS5 com tokenizador trigram) sobre as colunas de texto,
+        mantido em sincronia com a tabela servicos por triggers
+        Os textos são indexados sem acentos (o trigram já ignora maiúsculas e minúsculas), o que permite
+        buscas por substring. As triggers usam apenas SQL, para que outros programas possam gravar no banco
+        Retorna True se a busca textual estiver disponível
+        """
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'servicos_fts'")
+        existia = cursor.fetchone() is not None
+        colunas = ', '.join(CAMPOS_TEXTO)
+        try:
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS servicos_fts USING fts5({colunas}, tokenize='trigram')")
+        except sqlite3.OperationalError:
+            # SQLite sem FTS5 (ou sem o tokenizador trigram): os filtros continuam usando LIKE
+            return False
+
+        valores_novos = ', '.join(sql_sem_acentos(f"new.{campo}") for campo in CAMPOS_TEXTO)
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS servicos_fts_ai AFTER INSERT ON servicos BEGIN
+            INSERT INTO servicos_fts (rowid, {colunas}) VALUES (new.id, {valores_novos});
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS servicos_fts_ad AFTER DELETE ON servicos BEGIN
+            DELETE FROM servicos_fts WHERE rowid = old.id;
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS servicos_fts_au AFTER UPDATE OF {colunas} ON servicos BEGIN
+            DELETE FROM servicos_fts WHERE rowid = old.id;
+            INSERT INTO servicos_fts (rowid, {colunas}) VALUES (new.id, {valores_novos});
+        END
+        ''')
+
+        if not existia:
+            valores = ', '.join(sql_sem_acentos(campo) for campo in CAMPOS_TEXTO)
+            cursor.execute(f"INSERT INTO servicos_fts (rowid, {colunas}) SELECT id, {valores} FROM servicos")
+        return True
+
+    def create_resumo(self, conn):
+        """
+        Migração 5: cria a tabela resumo_servicos, com a quantidade de serviços por status, bairro, mês de
+        solicitação, mês de conclusão e veículo. Os totais são mantidos por triggers a cada
+        inserção, atualização e exclusão, de modo que o painel não precisa percorrer a tabela servicos
+        """
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'resumo_servicos'")
+        existia = cursor.fetchone() is not None
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS resumo_servicos (
+            dimensao TEXT NOT NULL,
+            valor TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimensao, valor)
+        ) WITHOUT ROWID
+        ''')
+
+        self._criar_triggers_resumo(cursor)
+        if not existia:
+            for dimensao in DIMENSOES_RESUMO:
+                self._totalizar_resumo(cursor, dimensao)
+
+    def _criar_triggers_resumo(self, cursor):
+        """Cria os triggers que mantêm os totais de resumo_servicos"""
+        colunas = 'status, bairro, data_solicitacao, data_conclusao, placa_veiculo'
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS resumo_ai AFTER INSERT ON servicos BEGIN {_somar_resumo('new')} END")
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS resumo_ad AFTER DELETE ON servicos BEGIN {_subtrair_resumo('old')} END")
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS resumo_au AFTER UPDATE OF {colunas} ON servicos BEGIN
+            {_subtrair_resumo('old')}
+            {_somar_resumo('new')}
+        END
+        ''')
+
+    def _totalizar_resumo(self, cursor, dimensao):
+        """Preenche os totais de uma dimensão de resumo_servicos percorrendo a tabela servicos"""
+        valor = DIMENSOES_RESUMO[dimensao].format(r='servicos')
+        cursor.execute(f'''
+        INSERT INTO resumo_servicos (dimensao, valor, total)
+        SELECT ?, {valor}, COUNT(*) FROM servicos WHERE {valor} IS NOT NULL GROUP BY {valor}
+        ''', (dimensao,))
+
+    def create_colunas_derivadas(self, conn):
+        """
+        Cria os triggers que calculam cpf_digitos e data_conclusao_iso (COLUNAS_DERIVADAS) e preenche
+        as linhas gravadas sem elas. A endereco_chave depende da normalização feita em Python
+        (chave_endereco): quando o endereço muda sem a chave, o trigger a anula para que seja recalculada.
+        Os triggers do resumo passam a contar o mês de conclusão a partir de data_conclusao
+        """
+        cursor = conn.cursor()
+        for trigger in ('resumo_ai', 'resumo_ad', 'resumo_au'):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        self._criar_triggers_resumo(cursor)
+        cursor.execute("DELETE FROM resumo_servicos WHERE dimensao = 'mes_conclusao'")
+        self._totalizar_resumo(cursor, 'mes_conclusao')
+
+        for coluna, (origem, expressao) in COLUNAS_DERIVADAS.items():
+            valor = expressao.format(r='new')
+            for sufixo, evento in (('ai', 'INSERT'), ('au', f'UPDATE OF {origem}')):
+                cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS servicos_{coluna}_{sufixo} AFTER {evento} ON servicos
+                WHEN new.{coluna} IS NOT {valor} BEGIN
+                    UPDATE servicos SET {coluna} = {valor} WHERE id = new.id;
+                END
+                ''')
+            cursor.execute(f'''
+            UPDATE servicos SET {coluna} = {expressao.format(r='servicos')}
+            WHERE {coluna} IS NULL AND {origem} IS NOT NULL
+            ''')
+
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS servicos_endereco_chave_au AFTER UPDATE OF bairro, rua, numero, quadra, lote
+        ON servicos WHEN new.endereco_chave IS old.endereco_chave BEGIN
+            UPDATE servicos SET endereco_chave = NULL WHERE id = new.id;
+        END
+        ''')
+        self._completar_chaves_endereco(conn)
+
+    def remover_indices_antigos(self, conn):
+        """
+        Migração 7: remove os índices de cpf e do endereço completo, que nenhuma consulta usa desde
+        as buscas por cpf_digitos e endereco_chave e só encareciam as gravações
+        """
+        cursor = conn.cursor()
+        cursor.execute('DROP INDEX IF EXISTS idx_cpf')
+        cursor.execute('DROP INDEX IF EXISTS idx_endereco')
+
+    def _completar_chaves_endereco(self, conn):
+        """
+        Calcula a endereco_chave dos serviços que estão sem ela (gravados por outro programa
+        ou com o endereço alterado por fora do sistema)
+        """
+        cursor = conn.cursor()
+        if cursor.execute("SELECT 1 FROM servicos WHERE endereco_chave IS NULL LIMIT 1").fetchone():
+            cursor.execute("UPDATE servicos SET endereco_chave = chave_endereco(bairro, rua, numero, quadra, lote) "
+                           "WHERE endereco_chave IS NULL")
+
+    def obter_resumo(self):
+        """
+        Lê os totais da tabela resumo_servicos
+        Retorna um dicionário {dimensao: [(valor, total), ...]}: meses do mais recente para o mais antigo
+        e as demais dimensões da maior para a menor quantidade
+        """
+        # A tabela de resumos pode ainda não existir se a inicialização foi adiada
+        self.concluir_inicializacao()
+        resumo = {dimensao: [] for dimensao in DIMENSOES_RESUMO}
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT dimensao, valor, total FROM resumo_servicos WHERE total > 0")
+            for row in cursor.fetchall():
+                resumo.setdefault(row['dimensao'], []).append((row['valor'], row['total']))
+        for dimensao, linhas in resumo.items():
+            if dimensao.startswith('mes'):
+                linhas.sort(reverse=True)
+            else:
+                linhas.sort(key=lambda linha: (-linha[1], linha[0]))
+        return resumo
 
     def validar_cpf(self, cpf):
         """Valida o CPF usando a biblioteca validate-docbr"""
@@ -71,80 +554,238 @@ class Database:
         """Formata o CPF com pontos e traço"""
         return self.cpf_validator.mask(cpf)
 
+    @staticmethod
+    def faixa_cpf(cpf):
+        """
+        Converte um CPF completo ou parcial (com ou sem pontuação) na faixa [inicio, fim)
+        de valores da coluna cpf_digitos que começam com esses dígitos
+        Retorna None se não houver dígitos
+        """
+        digitos = re.sub(r'\D', '', cpf or '')[:11]
+        if not digitos:
+            return None
+        escala = 10 ** (11 - len(digitos))
+        return int(digitos) * escala, (int(digitos) + 1) * escala
+
     def verificar_endereco_duplicado(self, bairro, rua, numero, quadra=None, lote=None, id_atual=None):
         """
         Verifica se já existe um serviço cadastrado para o mesmo endereço
+        A comparação usa a chave normalizada do endereço (coluna endereco_chave)
         Retorna o ID do serviço duplicado ou None se não houver duplicidade
         """
         with self.get_connection() as conn:
+            self._completar_chaves_endereco(conn)
             cursor = conn.cursor()
-            query = '''
-            SELECT id FROM servicos 
-            WHERE bairro = ? AND rua = ? AND numero = ?
-            '''
-            params = [bairro, rua, numero]
-
-            if quadra:
-                query += ' AND quadra = ?'
-                params.append(quadra)
-            else:
-                query += ' AND (quadra IS NULL OR quadra = "")'
-
-            if lote:
-                query += ' AND lote = ?'
-                params.append(lote)
-            else:
-                query += ' AND (lote IS NULL OR lote = "")'
+            query = "SELECT id FROM servicos WHERE endereco_chave = ?"
+            params = [chave_endereco(bairro, rua, numero, quadra, lote)]
 
             if id_atual:
                 query += ' AND id != ?'
                 params.append(id_atual)
 
-            cursor.execute(query, params)
+            cursor.execute(query + ' LIMIT 1', params)
             result = cursor.fetchone()
             return result['id'] if result else None
 
+    def verificar_enderecos_duplicados(self, chaves, tamanho_lote=500):
+        """
+        Versão em lote de verificar_endereco_duplicado: recebe chaves geradas por chave_endereco
+        Retorna um dicionário {chave: id do serviço já cadastrado} apenas com as chaves encontradas
+        """
+        chaves = list(dict.fromkeys(chaves))
+        encontrados = {}
+        with self.get_connection() as conn:
+            self._completar_chaves_endereco(conn)
+            cursor = conn.cursor()
+            for inicio in range(0, len(chaves), tamanho_lote):
+                parte = chaves[inicio:inicio + tamanho_lote]
+                cursor.execute(f'''
+                SELECT endereco_chave, MIN(id) AS id FROM servicos
+                WHERE endereco_chave IN ({', '.join(['?'] * len(parte))})
+                GROUP BY endereco_chave
+                ''', parte)
+                encontrados.update((row['endereco_chave'], row['id']) for row in cursor.fetchall())
+        return encontrados
+
+    def _preparar_insercao(self, dados):
+        """
+        Prepara uma cópia dos dados para inserção: formata o CPF, preenche ou normaliza a data de
+        solicitação e calcula a endereco_chave (as demais colunas derivadas vêm dos triggers)
+        Lança ValueError se a data de solicitação não for reconhecida
+        """
+        dados = dict(dados)
+        if 'cpf' in dados and dados['cpf']:
+            dados['cpf'] = self.formatar_cpf(re.sub(r'\D', '', dados['cpf']))
+
+        if 'data_solicitacao' not in dados or not dados['data_solicitacao']:
+            dados['data_solicitacao'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        else:
+            dados['data_solicitacao'] = normalizar_data_solicitacao(dados['data_solicitacao'])
+
+        dados['endereco_chave'] = chave_endereco(dados.get('bairro'), dados.get('rua'), dados.get('numero'),
+                                                 dados.get('quadra'), dados.get('lote'))
+        return dados
+
     def inserir_servico(self, dados):
         """
         Insere um novo serviço no banco de dados
         Retorna o ID do serviço inserido
         """
+        dados = self._preparar_insercao(dados)
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            if 'cpf' in dados and dados['cpf']:
-                cpf_limpo = re.sub(r'\D', '', dados['cpf'])
-                dados['cpf'] = self.formatar_cpf(cpf_limpo)
-
-            if 'data_solicitacao' not in dados or not dados['data_solicitacao']:
-                dados['data_solicitacao'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
             campos = ', '.join(dados.keys())
             placeholders = ', '.join(['?'] * len(dados))
             query = f"INSERT INTO servicos ({campos}) VALUES ({placeholders})"
             valores = list(dados.values())
 
             cursor.execute(query, valores)
-            conn.commit()
-            return cursor.lastrowid
+            id_servico = cursor.lastrowid
+        self._notificar_escrita('inserir', id_servico)
+        return id_servico
+
+    def inserir_servicos_em_lote(self, registros, tamanho_lote=500):
+        """
+        Insere vários serviços de uma vez, confirmando a transação a cada `tamanho_lote` registros
+        Os CPFs são validados uma única vez por valor distinto e as linhas com o mesmo conjunto
+        de colunas são gravadas com um único comando (INSERT ... SELECT)
+        Retorna (ids, erros): ids tem uma posição por registro recebido (None quando não inserido)
+        e erros é uma lista de tuplas (indice, mensagem)
+        """
+        ids = []
+        erros = []
+        cpfs_validados = {}
+
+        def preparar(indice, dados):
+            faltando = [campo for campo in CAMPOS_OBRIGATORIOS if not str(dados.get(campo) or '').strip()]
+            if faltando:
+                erros.append((indice, f"Campos obrigatórios ausentes: {', '.join(faltando)}"))
+                return None
+            cpf_limpo = re.sub(r'\D', '', str(dados['cpf']))
+            if cpf_limpo not in cpfs_validados:
+                cpfs_validados[cpf_limpo] = self.validar_cpf(cpf_limpo)
+            if not cpfs_validados[cpf_limpo]:
+                erros.append((indice, f"CPF inválido: {dados['cpf']}"))
+                return None
+            try:
+                return self._preparar_insercao(dict(dados, cpf=cpf_limpo))
+            except ValueError as e:
+                erros.append((indice, str(e)))
+                return None
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            lote = []
+            for indice, dados in enumerate(registros):
+                ids.append(None)
+                preparados = preparar(indice, dados)
+                if preparados is not None:
+                    lote.append((indice, preparados))
+                if len(lote) >= tamanho_lote:
+                    self._gravar_lote(conn, cursor, lote, ids, erros)
+                    lote = []
+            if lote:
+                self._gravar_lote(conn, cursor, lote, ids, erros)
 
-    def atualizar_servico(self, id_servico, dados):
+        for id_servico in ids:
+            if id_servico is not None:
+                self._notificar_escrita('inserir', id_servico)
+        erros.sort()
+        return ids, erros
+
+    def _gravar_lote(self, conn, cursor, lote, ids, erros):
+        """
+        Grava um lote de registros preparados em uma única transação
+        Se algum comando falhar, a transação é desfeita e o lote é gravado linha a linha,
+        para identificar os registros com problema sem perder os demais
+        """
+        grupos = {}
+        for indice, dados in lote:
+            grupos.setdefault(tuple(dados.keys()), []).append((indice, dados))
+
+        # Dentro de uma transação já aberta por quem chamou, só o lote pode ser desfeito
+        externa = conn.in_transaction
+        cursor.execute("SAVEPOINT lote_servicos" if externa else "BEGIN")
+        try:
+            for campos, linhas in grupos.items():
+                cursor.execute(self._comando_insercao_lote(campos),
+                               (json.dumps([list(dados.values()) for _, dados in linhas], default=str),))
+                if 'id' in campos:
+                    novos_ids = [dados['id'] for _, dados in linhas]
+                else:
+                    # Com AUTOINCREMENT e a transação de escrita aberta, os ids do grupo são consecutivos
+                    ultimo_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+                    novos_ids = range(ultimo_id - len(linhas) + 1, ultimo_id + 1)
+                for (indice, _), novo_id in zip(linhas, novos_ids):
+                    ids[indice] = novo_id
+        except sqlite3.DatabaseError:
+            if externa:
+                cursor.execute("ROLLBACK TO lote_servicos")
+            else:
+                conn.rollback()
+                cursor.execute("BEGIN")
+            for indice, dados in lote:
+                ids[indice] = None
+                try:
+                    cursor.execute(self._comando_insercao(tuple(dados.keys())), list(dados.values()))
+                    ids[indice] = cursor.lastrowid
+                except sqlite3.DatabaseError as e:
+                    erros.append((indice, str(e)))
+        if externa:
+            cursor.execute("RELEASE lote_servicos")
+        conn.commit()
+
+    @staticmethod
+    def _comando_insercao(campos):
+        return f"INSERT INTO servicos ({', '.join(campos)}) VALUES ({', '.join(['?'] * len(campos))})"
+
+    @staticmethod
+    def _comando_insercao_lote(campos):
+        """
+        INSERT ... SELECT que grava todas as linhas de um grupo em um único comando, a partir de um array JSON
+        Com executemany cada linha seria um comando, e a busca textual (FTS5) grava um segmento novo ao fim
+        de cada comando: a carga ficava mais lenta a cada lote, conforme o índice crescia
+        """
+        valores = ', '.join(f"json_extract(value, '$[{posicao}]')" for posicao in range(len(campos)))
+        return f"INSERT INTO servicos ({', '.join(campos)}) SELECT {valores} FROM json_each(?) ORDER BY key"
+
+    def atualizar_servico(self, id_servico, dados, original=None):
         """
         Atualiza um serviço existente no banco de dados
+        Com `original` (o serviço como foi lido para edição), só grava se os campos alterados ainda
+        tiverem os valores lidos; se outra gravação os mudou nesse meio tempo, lança ConflitoAtualizacao
+        Lança ValueError se a data de solicitação não for reconhecida
         Retorna True se a atualização foi bem-sucedida
         """
+        dados = dict(dados)
+        if 'data_solicitacao' in dados:
+            dados['data_solicitacao'] = normalizar_data_solicitacao(dados['data_solicitacao'])
         with self.get_connection() as conn:
             cursor = conn.cursor()
             if 'cpf' in dados and dados['cpf']:
-                cpf_limpo = re.sub(r'\D', '', dados['cpf'])
-                dados['cpf'] = self.formatar_cpf(cpf_limpo)
+                dados['cpf'] = self.formatar_cpf(re.sub(r'\D', '', dados['cpf']))
 
             atualizacoes = [f"{campo} = ?" for campo in dados.keys()]
-            query = f"UPDATE servicos SET {', '.join(atualizacoes)} WHERE id = ?"
+            condicoes = ['id = ?']
             valores = list(dados.values()) + [id_servico]
+            if original is not None:
+                condicoes += [f"{campo} IS ?" for campo in dados.keys()]
+                valores += [original.get(campo) for campo in dados.keys()]
+            query = f"UPDATE servicos SET {', '.join(atualizacoes)} WHERE {' AND '.join(condicoes)}"
 
             cursor.execute(query, valores)
-            conn.commit()
-            return cursor.rowcount > 0
+            atualizado = cursor.rowcount > 0
+            if not atualizado and original is not None:
+                cursor.execute("SELECT 1 FROM servicos WHERE id = ?", (id_servico,))
+                if cursor.fetchone():
+                    raise ConflitoAtualizacao(f"O serviço {id_servico} foi alterado por outra gravação")
+            if atualizado and CAMPOS_ENDERECO.intersection(dados):
+                cursor.execute(
+                    "UPDATE servicos SET endereco_chave = chave_endereco(bairro, rua, numero, quadra, lote) WHERE id = ?",
+                    (id_servico,))
+        if atualizado:
+            self._notificar_escrita('atualizar', id_servico)
+        return atualizado
 
     def excluir_servico(self, id_servico):
         """
@@ -154,19 +795,166 @@ class Database:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM servicos WHERE id = ?", (id_servico,))
-            conn.commit()
-            return cursor.rowcount > 0
+            excluido = cursor.rowcount > 0
+        if excluido:
+            self._notificar_escrita('excluir', id_servico)
+        return excluido
 
-    def obter_servico(self, id_servico):
+    def obter_servico(self, id_servico, incluir_arquivo=False):
         """
-        Obtém um serviço pelo ID
+        Obtém um serviço pelo ID; com incluir_arquivo=True, procura também no banco de arquivo
         Retorna um dicionário com os dados do serviço ou None se não encontrado
         """
+        tabelas = self._tabelas_servicos(incluir_arquivo)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            for tabela in tabelas:
+                cursor.execute(f"SELECT {COLUNAS_SERVICO} FROM {tabela} WHERE id = ?", (id_servico,))
+                row = cursor.fetchone()
+                if row:
+                    return dict(row)
+        return None
+
+    def obter_servicos(self, ids, tamanho_lote=500, incluir_arquivo=False):
+        """
+        Obtém vários serviços pelos IDs, na ordem em que foram informados
+        IDs inexistentes são ignorados; com incluir_arquivo=True, os que não estiverem na tabela
+        principal são procurados no banco de arquivo
+        """
+        ids = [int(id_servico) for id_servico in ids]
+        encontrados = {}
+        tabelas = self._tabelas_servicos(incluir_arquivo)
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM servicos WHERE id = ?", (id_servico,))
-            row = cursor.fetchone()
-            return dict(row) if row else None
+            for tabela in tabelas:
+                faltando = [id_servico for id_servico in dict.fromkeys(ids) if id_servico not in encontrados]
+                for inicio in range(0, len(faltando), tamanho_lote):
+                    parte = faltando[inicio:inicio + tamanho_lote]
+                    marcadores = ', '.join(['?'] * len(parte))
+                    cursor.execute(f"SELECT {COLUNAS_SERVICO} FROM {tabela} WHERE id IN ({marcadores})", parte)
+                    encontrados.update((row['id'], dict(row)) for row in cursor.fetchall())
+        return [encontrados[id_servico] for id_servico in dict.fromkeys(ids) if id_servico in encontrados]
+
+    @staticmethod
+    def inclui_arquivo(filtros):
+        """Indica se os filtros pedem os serviços arquivados (filtro incluir_arquivo, também como texto)"""
+        valor = (filtros or {}).get('incluir_arquivo')
+        if isinstance(valor, str):
+            return valor.strip().lower() in ('1', 'true', 'sim')
+        return bool(valor)
+
+    def _tabelas_servicos(self, incluir_arquivo):
+        if not incluir_arquivo:
+            return ('servicos',)
+        self.preparar_arquivo()
+        return ('servicos', 'arquivo.servicos')
+
+    def _selecionar_servicos(self, filtros, colunas=COLUNAS_SERVICO, condicoes=(), parametros=()):
+        """
+        Monta o SELECT dos serviços que atendem aos filtros e às condições extras
+        Com o filtro incluir_arquivo, une (UNION ALL) os serviços do banco de arquivo, filtrados sem a
+        busca textual, que indexa apenas a tabela principal, e sem os IDs que ainda estão na tabela
+        principal (o arquivamento copia e exclui em transações separadas)
+        Retorna a consulta e a lista de parâmetros
+        """
+        consultas = []
+        params = []
+        for tabela in self._tabelas_servicos(self.inclui_arquivo(filtros)):
+            conditions, parametros_tabela = self._montar_filtros(filtros, usar_fts=tabela == 'servicos')
+            conditions += condicoes
+            if tabela != 'servicos':
+                conditions.append("NOT EXISTS (SELECT 1 FROM main.servicos h WHERE h.id = arquivo.servicos.id)")
+            consulta = f"SELECT {colunas} FROM {tabela}"
+            if conditions:
+                consulta += " WHERE " + " AND ".join(conditions)
+            consultas.append(consulta)
+            params += parametros_tabela + list(parametros)
+        return " UNION ALL ".join(consultas), params
+
+    def _montar_filtros(self, filtros, usar_fts=True):
+        """
+        Monta a cláusula WHERE a partir do dicionário de filtros
+        Com usar_fts=False, os filtros de texto usam LIKE mesmo com a busca textual disponível
+        Retorna a lista de condições e a lista de parâmetros
+        """
+        conditions = []
+        params = []
+        termos_fts = []
+        if filtros:
+            for campo, valor in filtros.items():
+                campo_sanitizado = campo.lower()
+                if campo_sanitizado == 'cpf':
+                    # CPF parcial é tratado como prefixo: busca por faixa no índice idx_cpf_digitos
+                    faixa = self.faixa_cpf(valor)
+                    if faixa:
+                        conditions.append("cpf_digitos >= ? AND cpf_digitos < ?")
+                        params.extend(faixa)
+                elif campo_sanitizado in CAMPOS_TEXTO:
+                    valor_normalizado = normalizar_texto(valor)
+                    # O tokenizador trigram só consegue buscar termos com 3 ou mais caracteres
+                    if usar_fts and self.fts_disponivel and len(valor_normalizado) >= 3:
+                        termo = valor_normalizado.replace('"', '""')
+                        termos_fts.append(f'{campo_sanitizado} : "{termo}"')
+                    else:
+                        conditions.append(f"normalizar({campo_sanitizado}) LIKE ?")
+                        params.append(f"%{valor_normalizado}%")
+                elif campo_sanitizado in ['id', 'numero', 'status']:
+                    conditions.append(f"{campo_sanitizado} LIKE ?")
+                    params.append(f"%{valor}%")
+                elif campo_sanitizado in FILTROS_DATA:
+                    # Comparação direta com a coluna em AAAA-MM-DD, para usar a busca por faixa no índice
+                    data = data_iso(valor)
+                    if data:
+                        coluna, operador = FILTROS_DATA[campo_sanitizado]
+                        if campo_sanitizado == 'solicitacao_ate':
+                            # data_solicitacao tem hora: o limite é o início do dia seguinte
+                            data = (datetime.strptime(data, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+                        conditions.append(f"{coluna} {operador} ?")
+                        params.append(data)
+        if termos_fts:
+            conditions.insert(0, "id IN (SELECT rowid FROM servicos_fts WHERE servicos_fts MATCH ?)")
+            params.insert(0, " AND ".join(termos_fts))
+        return conditions, params
+
+    def contar_servicos(self, filtros=None):
+        """
+        Conta os serviços que atendem aos filtros
+        O resultado fica em cache por conjunto de filtros até a próxima escrita no banco,
+        inclusive as feitas por outros processos (detectadas pelo PRAGMA data_version)
+        """
+        chave = tuple(sorted((filtros or {}).items()))
+
+        with self.get_connection() as conn:
+            versao_dados = self._versao_dados(conn)
+            with self._lock_contagens:
+                em_cache = self._contagens.get(chave)
+                if em_cache and em_cache[0] == versao_dados:
+                    return em_cache[1]
+                geracao = self._geracao_contagens
+
+            # Com o arquivo incluído, uma contagem por tabela
+            count_query, params = self._selecionar_servicos(filtros, "COUNT(*) as total")
+            cursor = conn.cursor()
+            cursor.execute(count_query, params)
+            total = sum(row['total'] for row in cursor.fetchall())
+        with self._lock_contagens:
+            # Se houve escrita durante a contagem, o total pode já estar desatualizado
+            if self._geracao_contagens == geracao:
+                if chave not in self._contagens and len(self._contagens) >= self.MAX_CONTAGENS:
+                    self._contagens.pop(next(iter(self._contagens)))
+                self._contagens[chave] = (versao_dados, total)
+        return total
+
+    def _versao_dados(self, conn):
+        """
+        Identifica o estado do banco visto pela conexão
+        O data_version só muda com escritas de outras conexões e só é comparável na mesma
+        conexão; as escritas deste processo já invalidam as contagens pelo _notificar_escrita
+        """
+        versoes = [conn.execute("PRAGMA main.data_version").fetchone()[0]]
+        if self.banco_arquivo:
+            versoes.append(conn.execute("PRAGMA arquivo.data_version").fetchone()[0])
+        return (id(conn), *versoes)
 
     def listar_servicos(self, filtros=None, ordem="data_solicitacao DESC", pagina=1, itens_por_pagina=None):
         """
@@ -175,24 +963,9 @@ class Database:
         """
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            query = "SELECT * FROM servicos"
-            count_query = "SELECT COUNT(*) as total FROM servicos"
-            params = []
-
-            if filtros:
-                conditions = []
-                for campo, valor in filtros.items():
-                    campo_sanitizado = campo.lower()
-                    if campo_sanitizado in ['id', 'cpf', 'nome', 'telefone', 'bairro', 'rua', 'numero', 'status']:
-                        conditions.append(f"{campo_sanitizado} LIKE ?")
-                        params.append(f"%{valor}%")
-                if conditions:
-                    where_clause = " WHERE " + " AND ".join(conditions)
-                    query += where_clause
-                    count_query += where_clause
+            query, params = self._selecionar_servicos(filtros)
 
-            cursor.execute(count_query, params)
-            total_registros = cursor.fetchone()['total']
+            total_registros = self.contar_servicos(filtros)
 
             query += f" ORDER BY {ordem}"
 
@@ -205,37 +978,361 @@ class Database:
             servicos = [dict(row) for row in rows]
             return servicos, total_registros
 
+    def iterar_servicos(self, filtros=None, ordem="data_solicitacao DESC", colunas=None, tamanho_lote=1000):
+        """
+        Percorre os serviços filtrados sem carregar todos na memória
+        Gera listas de até `tamanho_lote` linhas (sqlite3.Row) lidas do cursor com fetchmany
+        """
+        query, params = self._selecionar_servicos(filtros, ', '.join(colunas) if colunas else COLUNAS_SERVICO)
+        query += f" ORDER BY {ordem}"
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            while True:
+                linhas = cursor.fetchmany(tamanho_lote)
+                if not linhas:
+                    break
+                yield linhas
+
+    def listar_servicos_janela(self, filtros=None, deslocamento=0, limite=200, apos=None):
+        """
+        Lista uma janela de `limite` serviços na ordem da lista (mais recentes primeiro)
+        Se `apos` for informado (tupla data_solicitacao, id da última linha da janela anterior),
+        a janela começa logo depois dele usando o índice idx_data; caso contrário usa o deslocamento
+        """
+        if apos:
+            query, params = self._selecionar_servicos(filtros, condicoes=["(data_solicitacao, id) < (?, ?)"],
+                                                      parametros=apos)
+        else:
+            query, params = self._selecionar_servicos(filtros)
+        query += f" ORDER BY data_solicitacao DESC, id DESC LIMIT {int(limite)}"
+        if not apos and deslocamento:
+            query += f" OFFSET {int(deslocamento)}"
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def _codificar_token(direcao, servico):
+        dados = json.dumps([direcao, servico['data_solicitacao'], servico['id']])
+        return base64.urlsafe_b64encode(dados.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def _decodificar_token(token):
+        try:
+            direcao, data, id_servico = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Token de paginação inválido: {token}") from e
+        if direcao not in ('p', 'a'):
+            raise ValueError(f"Token de paginação inválido: {token}")
+        return direcao, data, id_servico
+
+    def listar_servicos_pagina(self, filtros=None, itens_por_pagina=20, token=None, ultima=False):
+        """
+        Lista uma página de serviços usando paginação por cursor (keyset) sobre
+        (data_solicitacao, id), mais recentes primeiro, aproveitando o índice idx_data
+        Sem token retorna a primeira página; com ultima=True retorna a última página
+        Retorna (servicos, total_registros, token_anterior, token_proximo)
+        """
+        total_registros = self.contar_servicos(filtros)
+
+        direcao = None
+        condicoes, parametros = [], []
+        if ultima:
+            ordem = "ASC"
+            limite = total_registros % itens_por_pagina or itens_por_pagina
+        else:
+            limite = itens_por_pagina + 1
+            ordem = "DESC"
+            if token:
+                direcao, data, id_servico = self._decodificar_token(token)
+                if direcao == 'p':
+                    condicoes = ["(data_solicitacao, id) < (?, ?)"]
+                else:
+                    condicoes = ["(data_solicitacao, id) > (?, ?)"]
+                    ordem = "ASC"
+                parametros = [data, id_servico]
+
+        query, params = self._selecionar_servicos(filtros, condicoes=condicoes, parametros=parametros)
+        query += f" ORDER BY data_solicitacao {ordem}, id {ordem} LIMIT {limite}"
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            servicos = [dict(row) for row in cursor.fetchall()]
+
+        mais_registros = len(servicos) > itens_por_pagina
+        servicos = servicos[:itens_por_pagina]
+        if ordem == "ASC":
+            servicos.reverse()
+
+        if ultima:
+            tem_anterior, tem_proximo = total_registros > len(servicos), False
+        elif direcao == 'a':
+            tem_anterior, tem_proximo = mais_registros, True
+        else:
+            tem_anterior, tem_proximo = direcao == 'p', mais_registros
+
+        token_anterior = self._codificar_token('a', servicos[0]) if servicos and tem_anterior else None
+        token_proximo = self._codificar_token('p', servicos[-1]) if servicos and tem_proximo else None
+        return servicos, total_registros, token_anterior, token_proximo
+
     def buscar_por_cpf(self, cpf):
         """
-        Busca serviços por CPF
+        Busca serviços por CPF, completo ou apenas os primeiros dígitos
         Retorna uma lista de serviços que correspondem ao CPF
         """
+        faixa = self.faixa_cpf(cpf)
+        if not faixa:
+            return []
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cpf_formatado = self.formatar_cpf(re.sub(r'\D', '', cpf))
-            cursor.execute("SELECT * FROM servicos WHERE cpf = ?", (cpf_formatado,))
+            cursor.execute(f"SELECT {COLUNAS_SERVICO} FROM servicos WHERE cpf_digitos >= ? AND cpf_digitos < ?", faixa)
             rows = cursor.fetchall()
             return [dict(row) for row in rows]
 
+    def preparar_arquivo(self):
+        """
+        Garante a tabela servicos no banco de arquivo com as mesmas colunas, na mesma ordem, da tabela
+        principal, já que as consultas com o arquivo incluído unem as duas com SELECT *
+        """
+        if self._arquivo_preparado:
+            return
+        with self._lock_arquivo:
+            if self._arquivo_preparado:
+                return
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("SELECT 1 FROM arquivo.sqlite_master WHERE type = 'table' AND name = 'servicos'")
+                if cursor.fetchone() is None:
+                    cursor.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = 'servicos'")
+                    definicao = cursor.fetchone()['sql']
+                    cursor.execute(re.sub(r'^CREATE TABLE\s+"?servicos"?', 'CREATE TABLE arquivo.servicos', definicao))
+                    cursor.execute('CREATE INDEX arquivo.idx_arquivo_data ON servicos (data_solicitacao)')
+                    cursor.execute('CREATE INDEX arquivo.idx_arquivo_cpf_digitos ON servicos (cpf_digitos)')
+                    cursor.execute('CREATE INDEX arquivo.idx_arquivo_data_conclusao ON servicos (data_conclusao_iso)')
+                else:
+                    # Colunas acrescentadas à tabela principal depois que o arquivo foi criado
+                    cursor.execute("PRAGMA arquivo.table_info(servicos)")
+                    existentes = {row['name'] for row in cursor.fetchall()}
+                    cursor.execute("PRAGMA main.table_info(servicos)")
+                    for row in cursor.fetchall():
+                        if row['name'] not in existentes:
+                            cursor.execute(f"ALTER TABLE arquivo.servicos ADD COLUMN {row['name']} {row['type']}")
+            self._arquivo_preparado = True
+
+    def arquivar_servicos(self, dias=365, tamanho_lote=500, status=STATUS_ARQUIVAVEIS):
+        """
+        Move para o banco de arquivo os serviços com os status informados (concluídos e cancelados)
+        encerrados há mais de `dias` dias: vale a data de conclusão ou, sem ela, a de solicitação
+        Cada lote é copiado para o arquivo em uma transação e excluído da tabela principal em outra,
+        de modo que uma interrupção entre as duas nunca perde serviços. Os totais de resumo_servicos
+        não mudam: o painel continua contando os serviços arquivados
+        Retorna a quantidade de serviços arquivados
+        """
+        # resumo_servicos precisa existir antes das exclusões
+        self.concluir_inicializacao()
+        self.preparar_arquivo()
+        limite = (datetime.now() - timedelta(days=dias)).strftime('%Y-%m-%d')
+        with self.get_connection() as conn:
+            colunas = [row['name'] for row in conn.execute("PRAGMA main.table_info(servicos)").fetchall()]
+        lista_colunas = ', '.join(colunas)
+        iguais = ' AND '.join(f"a.{coluna} IS servicos.{coluna}" for coluna in colunas)
+        with self.get_connection() as conn:
+            # Cópias deixadas por uma execução interrompida, de serviços que continuam na tabela principal
+            conn.execute("DELETE FROM arquivo.servicos WHERE id IN (SELECT id FROM main.servicos)")
+
+        arquivados = 0
+        while True:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN")
+                cursor.execute(f'''
+                SELECT id FROM servicos
+                WHERE status IN ({', '.join(['?'] * len(status))})
+                AND coalesce(data_conclusao_iso, data_solicitacao) < ?
+                ORDER BY id LIMIT ?
+                ''', (*status, limite, int(tamanho_lote)))
+                ids = [row['id'] for row in cursor.fetchall()]
+                marcadores = ', '.join(['?'] * len(ids))
+                if ids:
+                    # OR REPLACE: uma cópia deixada por uma execução interrompida é sobrescrita
+                    cursor.execute(f"INSERT OR REPLACE INTO arquivo.servicos ({lista_colunas}) "
+                                   f"SELECT {lista_colunas} FROM main.servicos WHERE id IN ({marcadores})", ids)
+            if not ids:
+                break
+
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                # Só sai da tabela principal o que for idêntico à cópia; um serviço alterado entre as duas
+                # transações continua nela e a cópia desatualizada é descartada
+                copiados = f"id IN ({marcadores}) AND EXISTS " \
+                           f"(SELECT 1 FROM arquivo.servicos a WHERE a.id = servicos.id AND {iguais})"
+                # A trigger resumo_ad desconta os excluídos; eles são somados de volta antes, na mesma transação
+                for dimensao, expressao in DIMENSOES_RESUMO.items():
+                    cursor.execute(f'''
+                    INSERT INTO resumo_servicos (dimensao, valor, total)
+                    SELECT ?, valor, COUNT(*) FROM (SELECT {expressao.format(r='servicos')} AS valor
+                                                    FROM servicos WHERE {copiados})
+                    WHERE valor IS NOT NULL GROUP BY valor
+                    ON CONFLICT (dimensao, valor) DO UPDATE SET total = total + excluded.total
+                    ''', [dimensao] + ids)
+                cursor.execute(f"DELETE FROM servicos WHERE {copiados}", ids)
+                excluidos = cursor.rowcount
+                cursor.execute(f"DELETE FROM arquivo.servicos WHERE id IN ({marcadores}) "
+                               f"AND id IN (SELECT id FROM main.servicos)", ids)
+            if not excluidos:
+                break
+            arquivados += excluidos
+            self._notificar_escrita('arquivar', None)
+
+        if arquivados:
+            # A distribuição dos dados mudou nas duas tabelas
+            self.atualizar_estatisticas(completo=True)
+        return arquivados
+
+
+class ConnectionPool:
+    """
+    Pool de conexões SQLite reaproveitadas entre as chamadas do Database.
+    Cada conexão é aberta uma única vez, já configurada com WAL e pragmas de desempenho
+    (e com o banco de arquivo anexado como `arquivo`, se informado),
+    e é usada por apenas uma thread de cada vez.
+    """
+    def __init__(self, db_file, max_conexoes=5, cache_size=-20000, mmap_size=268435456, busy_timeout=5000,
+                 banco_arquivo=None):
+        self.db_file = db_file
+        self.banco_arquivo = banco_arquivo
+        self.max_conexoes = max_conexoes
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+        self._livres = queue.LifoQueue()
+        self._todas = []
+        # Conexões em uso durante o fechar(), fechadas quando forem devolvidas
+        self._fechar_ao_liberar = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _abrir_conexao(self):
+        conn = sqlite3.connect(self.db_file, timeout=self.busy_timeout / 1000, check_same_thread=False,
+                               factory=ConexaoInstrumentada)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size={int(self.cache_size)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.create_function('normalizar', 1, normalizar_texto, deterministic=True)
+        conn.create_function('chave_endereco', 5, chave_endereco, deterministic=True)
+        conn.create_function('data_iso', 1, data_iso, deterministic=True)
+        if self.banco_arquivo:
+            conn.execute("ATTACH DATABASE ? AS arquivo", (self.banco_arquivo,))
+            conn.execute('PRAGMA arquivo.journal_mode=WAL')
+            conn.execute('PRAGMA arquivo.synchronous=NORMAL')
+        return conn
+
+    def adquirir(self):
+        """
+        Retorna uma conexão para a thread atual.
+        Chamadas aninhadas na mesma thread reutilizam a conexão já adquirida; se já houver
+        uma transação aberta, a chamada aninhada roda em um SAVEPOINT, para que uma falha
+        desfaça apenas o que ela gravou.
+        """
+        em_uso = getattr(self._local, 'conexao', None)
+        if em_uso is not None:
+            self._local.profundidade += 1
+            savepoint = None
+            if em_uso.in_transaction:
+                savepoint = f"nivel_{self._local.profundidade}"
+                em_uso.execute(f"SAVEPOINT {savepoint}")
+            self._local.savepoints.append(savepoint)
+            return em_uso
+
+        try:
+            conn = self._livres.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                criar = len(self._todas) < self.max_conexoes
+                if criar:
+                    conn = self._abrir_conexao()
+                    self._todas.append(conn)
+            if not criar:
+                conn = self._livres.get()
+
+        self._local.conexao = conn
+        self._local.profundidade = 1
+        self._local.savepoints = []
+        return conn
+
+    def liberar(self, conn, sucesso=True):
+        """
+        Devolve a conexão ao pool quando a chamada mais externa da thread termina,
+        confirmando ou desfazendo a transação pendente.
+        Retorna True se a conexão foi de fato devolvida.
+        """
+        self._local.profundidade -= 1
+        if self._local.profundidade > 0:
+            savepoint = self._local.savepoints.pop()
+            # O SAVEPOINT pode já ter sido encerrado por um commit explícito dentro da chamada
+            if savepoint and conn.in_transaction:
+                if not sucesso:
+                    conn.execute(f"ROLLBACK TO {savepoint}")
+                conn.execute(f"RELEASE {savepoint}")
+            return False
+        self._local.conexao = None
+        try:
+            if sucesso:
+                conn.commit()
+            else:
+                conn.rollback()
+        finally:
+            with self._lock:
+                fechar = conn in self._fechar_ao_liberar
+                self._fechar_ao_liberar.discard(conn)
+            if fechar:
+                conn.close()
+            else:
+                self._livres.put(conn)
+        return True
+
+    def fechar(self):
+        """
+        Fecha as conexões livres do pool; as que ainda estão em uso por outra thread
+        são fechadas quando forem devolvidas, em vez de no meio da operação
+        """
+        with self._lock:
+            livres = []
+            while True:
+                try:
+                    livres.append(self._livres.get_nowait())
+                except queue.Empty:
+                    break
+            for conn in livres:
+                conn.close()
+            self._fechar_ao_liberar.update(conn for conn in self._todas if conn not in livres)
+            self._todas.clear()
+
 
 class DatabaseConnection:
     """
     Classe para gerenciar conexões com o banco de dados usando context manager
     """
-    def __init__(self, db_file):
-        self.db_file = db_file
+    def __init__(self, pool):
+        self.pool = pool
         self.connection = None
 
     def __enter__(self):
-        self.connection = sqlite3.connect(self.db_file)
-        self.connection.row_factory = sqlite3.Row
+        self.connection = self.pool.adquirir()
         return self.connection
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.connection:
-            if exc_type is None:
-                self.connection.commit()
-            else:
-                self.connection.rollback()
-            self.connection.close()
-        return False
\ No newline at end of file
+            self.pool.liberar(self.connection, sucesso=exc_type is None)
+        return False
@@ -1,49 +1,100 @@
 # -*- coding: utf-8 -*-
 import os
-import pandas as pd
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import cm
-from reportlab.lib.enums import TA_LEFT, TA_CENTER
 from datetime import datetime
 import re
+import csv
+import itertools
+import gzip
+import bz2
+import lzma
 import tempfile
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pdf_cache import CachePDF
+from instrumentacao import instrumentacao
 
+# Cabeçalhos usados nas planilhas exportadas (e reconhecidos na importação)
+COLUNAS_EXPORTACAO = {
+    'id': 'Protocolo', 'data_solicitacao': 'Data Solicitação', 'cpf': 'CPF', 'nome': 'Nome',
+    'inscricao_municipal': 'Inscrição Municipal', 'telefone': 'Telefone', 'bairro': 'Bairro',
+    'rua': 'Rua', 'numero': 'Número', 'referencia': 'Referência', 'quadra': 'Quadra',
+    'lote': 'Lote', 'numero_fossas': 'Número de Fossas', 'status': 'Status',
+    'data_chegada': 'Hora Chegada', 'data_saida': 'Hora Saída', 'data_conclusao': 'Data Conclusão',
+    'placa_veiculo': 'Placa Veículo', 'motorista': 'Motorista', 'ajudante': 'Ajudante',
+    'observacao_empresa': 'Observações'
+}
 
-class ExportManager:
-    def __init__(self, database):
-        self.database = database
 
-    def exportar_excel(self, caminho_arquivo, filtros=None):
-        try:
-            servicos, _ = self.database.listar_servicos(filtros=filtros, itens_por_pagina=None)  # Exporta todos
-            if not servicos:
-                return False
+# Expressões SQL das colunas nas exportações analíticas (CSV/Parquet): datas em ISO 8601
+COLUNAS_ANALITICAS = {
+    'id': 'id',
+    'data_solicitacao': "replace(data_solicitacao, ' ', 'T')",
+    'numero_fossas': 'CAST(numero_fossas AS INTEGER)',
+    'data_conclusao': 'data_conclusao_iso',
+}
 
-            df = pd.DataFrame(servicos)
+# Compressões aceitas na exportação CSV, inferidas pela extensão do arquivo quando não informadas
+COMPRESSOES_CSV = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+EXTENSOES_COMPRESSAO = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
 
-            colunas = {
-                'id': 'Protocolo', 'data_solicitacao': 'Data Solicitação', 'cpf': 'CPF', 'nome': 'Nome',
-                'inscricao_municipal': 'Inscrição Municipal', 'telefone': 'Telefone', 'bairro': 'Bairro',
-                'rua': 'Rua', 'numero': 'Número', 'referencia': 'Referência', 'quadra': 'Quadra',
-                'lote': 'Lote', 'numero_fossas': 'Número de Fossas', 'status': 'Status',
-                'data_chegada': 'Hora Chegada', 'data_saida': 'Hora Saída', 'data_conclusao': 'Data Conclusão',
-                'placa_veiculo': 'Placa Veículo', 'motorista': 'Motorista', 'ajudante': 'Ajudante',
-                'observacao_empresa': 'Observações'
-            }
-
-            df = df.rename(columns=colunas)
-            df.to_excel(caminho_arquivo, index=False, sheet_name='Serviços')
-            return True
-        except Exception as e:
-            print(f"Erro ao exportar para Excel: {e}")
-            return False
 
-    def _footer_callback(self, canvas, doc):
-        canvas.saveState()
+class ModeloPDF:
+    """
+    Partes fixas da ordem de serviço: a folha de estilos é montada uma única vez e reaproveitada em cada PDF;
+    os títulos e a seção de checkboxes ficam como (texto, estilo), e viram flowables novos a cada documento,
+    já que o ReportLab guarda nos flowables o estado da montagem e eles não podem ser compartilhados
+    """
+    def __init__(self):
+        # O ReportLab só é importado quando o primeiro PDF é gerado (ou no aquecimento em segundo plano)
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.units import cm
+        from reportlab.lib.enums import TA_LEFT, TA_CENTER
+
+        styles = getSampleStyleSheet()
+        styles.add(
+            ParagraphStyle(name='TituloPrincipal', parent=styles['Heading1'], alignment=TA_CENTER, fontSize=15,
+                           spaceAfter=12))
+        styles.add(ParagraphStyle(name='Subtitulo', parent=styles['Heading2'], alignment=TA_CENTER, fontSize=14,
+                                  spaceAfter=6))
+        styles.add(
+            ParagraphStyle(name='Inform', fontName='Helvetica', fontSize=13, leading=14, alignment=TA_LEFT))
+        styles.add(ParagraphStyle(name='CheckInfo', parent=styles['Inform'], leftIndent=1 * cm))
+
+        styles.add(
+            ParagraphStyle(name='NormalFix', fontName='Helvetica', fontSize=11, leading=14, alignment=TA_LEFT))
+        styles.add(ParagraphStyle(name='Checkbox', parent=styles['NormalFix'], leftIndent=1 * cm))
+        self.styles = styles
+
+        # Texto e estilo de cada parágrafo fixo; um número no lugar do texto é um espaço com essa altura (em cm)
+        self.titulo_execucao = [("<b>Execução de Serviço</b>", 'Subtitulo'), 0.5]
+        self.titulo_empresa = [("<b>Dados da Empresa</b>", 'Subtitulo'), 0.8]
+
+        # --- SEÇÃO COM CHECKBOXES ---
+        self.secao_checkboxes = [
+            ("<b>Situação da Residência (TESTE):</b>", 'Subtitulo'),
+            0.5,
+            # Altere o texto após os quadrados conforme necessário
+            ("(_) Situação 1", 'NormalFix'),
+            ("(_) Situação 2", 'NormalFix'),
+            ("(_) Situação 3", 'NormalFix'),
+            ("(_) Outro Situação 4: ________________________________", 'NormalFix'),
+            0.5,
+        ]
+
+    def _flowables(self, partes):
+        """Cria os flowables de uma parte fixa do documento"""
+        from reportlab.platypus import Paragraph, Spacer
+        from reportlab.lib.units import cm
+
+        return [Spacer(1, parte * cm) if isinstance(parte, (int, float)) else Paragraph(parte[0], self.styles[parte[1]])
+                for parte in partes]
+
+    def desenhar_rodape(self, canvas, doc):
+        from reportlab.lib.units import cm
+
         y = 1.0 * cm
         center_x = doc.pagesize[0] / 2
+        canvas.saveState()
         canvas.setFont('Helvetica', 12)
         canvas.drawCentredString(center_x, y + 3 * cm, "Atesto a conclusão do serviço:")
         canvas.drawCentredString(center_x, y + 2 * cm, "___________________________________")
@@ -55,102 +106,330 @@ class ExportManager:
         canvas.drawCentredString(center_x, y - 0.1 * cm, "Email: meuemail@mail.com")
         canvas.restoreState()
 
-    def gerar_pdf(self, id_servico, caminho_arquivo):
+    def renderizar(self, servico, caminho_arquivo):
+        """Gera o PDF da ordem de serviço preenchendo apenas os campos variáveis"""
+        from reportlab.lib.pagesizes import A4
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+        from reportlab.lib.units import cm
+
+        styles = self.styles
+        doc = SimpleDocTemplate(caminho_arquivo, pagesize=A4, rightMargin=2 * cm, leftMargin=2 * cm,
+                                topMargin=2 * cm, bottomMargin=5 * cm)
+
+        # Máscara para o CPF (ex: 123.***.***-34)
+        cpf_limpo = re.sub(r'\D', '', servico['cpf'])
+        cpf_mascarado = f"{cpf_limpo[:3]}.***.***-{cpf_limpo[-2:]}"
+
+        elements = []
+        elements.append(
+            Paragraph(f"SOLICITAÇÃO DE SERVIÇO DE VACOL - Protocolo nº {servico['id']}", styles['TituloPrincipal']))
+        # A data já vem formatada da consulta (Database.COLUNAS_SERVICO)
+        elements.append(Paragraph(f"Serviço Solicitado em {servico['data_solicitacao_fmt']}", styles['Subtitulo']))
+        elements.append(Spacer(1, 0.5 * cm))
+
+        elements.append(Paragraph(f"<b>CPF:</b> {cpf_mascarado}", styles['Inform']))
+        elements.append(Paragraph(f"<b>Nome:</b> {servico['nome']}", styles['Inform']))
+        elements.append(Paragraph(f"<b>Tel/Cel:</b> {servico['telefone']}", styles['Inform']))
+        elements.append(Paragraph(f"<b>Bairro:</b> {servico['bairro']}", styles['Inform']))
+        elements.append(
+            Paragraph(f"<b>Endereço:</b> {servico['rua']}, Nº: {servico['numero']}", styles['Inform']))
+        elements.append(Paragraph(f"<b>QD:</b> {servico['quadra'] or ''}   <b>LT:</b> {servico['lote'] or ''}",
+                                  styles['Inform']))
+        elements.append(Paragraph(f"<b>Referência:</b> {servico['referencia'] or ''}", styles['Inform']))
+        elements.append(Paragraph(f"<b>Nº de Fossas:</b> {servico['numero_fossas'] or ''}", styles['Inform']))
+        elements.append(Spacer(1, 0.8 * cm))
+
+        chegada = servico.get('data_chegada') or '____:____'
+        saida = servico.get('data_saida') or '____:____'
+        conclusao = servico.get('data_conclusao') or '__/__/____'
+        elements.extend(self._flowables(self.titulo_execucao))
+        elements.append(Paragraph(
+            f"<b>Chegada:</b> {chegada}     <b>Saída:</b> {saida}     <b>(Concluída em:</b> {conclusao}<b>)</b>",
+            styles['NormalFix']))
+        elements.append(Spacer(1, 0.5 * cm))
+        elements.extend(self._flowables(self.titulo_empresa))
+        elements.append(Paragraph(
+            f"<b>Placa:</b> {servico.get('placa_veiculo') or '_____________'}   <b>Motorista:</b> {servico.get('motorista') or '_____________________'}   <b>Ajudante:</b> {servico.get('ajudante') or '_________________'}",
+            styles['NormalFix']))
+        elements.append(Spacer(1, 1 * cm))
+        obs = (servico.get('observacao_empresa') or (f'____________________________________________________________________________\n' +
+               f'____________________________________________________________________________' * 4))
+        elements.append(Paragraph(f"<b>Observação:</b> {obs}", styles['NormalFix']))
+        elements.append(Spacer(1, 1 * cm))
+
+        elements.extend(self._flowables(self.secao_checkboxes))
+
+        doc.build(elements, onFirstPage=self.desenhar_rodape, onLaterPages=self.desenhar_rodape)
+
+
+# Modelo usado pelos processos do pool de geração em lote (um por processo)
+_modelo_processo = None
+
+
+def _renderizar_pdf_processo(servico, caminho_arquivo):
+    """Executado nos processos do pool: retorna (id, mensagem de erro ou None)"""
+    global _modelo_processo
+    try:
+        if _modelo_processo is None:
+            _modelo_processo = ModeloPDF()
+        _modelo_processo.renderizar(servico, caminho_arquivo)
+        return servico['id'], None
+    except Exception as e:
+        return servico['id'], str(e)
+
+
+class ExportManager:
+    def __init__(self, database, cache_pdf=None):
+        self.database = database
+        self._modelo_pdf = None
+        self.cache_pdf = cache_pdf or CachePDF()
+        self.database.registrar_ouvinte(self._ao_escrever_servico)
+
+    def _ao_escrever_servico(self, operacao, id_servico):
+        if operacao in ('atualizar', 'excluir'):
+            self.cache_pdf.invalidar(id_servico)
+
+    @property
+    def modelo_pdf(self):
+        if self._modelo_pdf is None:
+            self._modelo_pdf = ModeloPDF()
+        return self._modelo_pdf
+
+    def aquecer(self):
+        """
+        Carrega antecipadamente as dependências de exportação (openpyxl e ReportLab) e monta o modelo
+        do PDF, para que a primeira exportação não espere por elas. Feito para rodar em segundo plano.
+        """
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError as e:
+            print(f"Dependência de exportação indisponível: {e}")
+        try:
+            self.modelo_pdf
+        except ImportError as e:
+            print(f"Dependência de exportação indisponível: {e}")
+
+    @instrumentacao.cronometrar('exportar_excel')
+    def exportar_excel(self, caminho_arquivo, filtros=None, streaming=False):
+        if streaming:
+            return self.exportar_excel_streaming(caminho_arquivo, filtros)
+        import pandas as pd
+
+        try:
+            servicos, _ = self.database.listar_servicos(filtros=filtros, itens_por_pagina=None)  # Exporta todos
+            if not servicos:
+                return False
+
+            df = pd.DataFrame(servicos)
+            df = df[[coluna for coluna in COLUNAS_EXPORTACAO if coluna in df.columns]]
+            df = df.rename(columns=COLUNAS_EXPORTACAO)
+            df.to_excel(caminho_arquivo, index=False, sheet_name='Serviços')
+            return True
+        except Exception as e:
+            print(f"Erro ao exportar para Excel: {e}")
+            return False
+
+    @instrumentacao.cronometrar('exportar_excel_streaming')
+    def exportar_excel_streaming(self, caminho_arquivo, filtros=None, tamanho_lote=1000):
+        """
+        Exporta para Excel lendo o banco em lotes e gravando linha a linha com o openpyxl
+        em modo write-only, de modo que o uso de memória não cresce com o número de registros
+        """
+        from openpyxl import Workbook
+
         try:
-            servico = self.database.obter_servico(id_servico)
-            if not servico:
+            lotes = self.database.iterar_servicos(filtros=filtros, colunas=list(COLUNAS_EXPORTACAO),
+                                                  tamanho_lote=tamanho_lote)
+            primeiro_lote = next(lotes, None)
+            if not primeiro_lote:
                 return False
 
-            doc = SimpleDocTemplate(caminho_arquivo, pagesize=A4, rightMargin=2 * cm, leftMargin=2 * cm,
-                                    topMargin=2 * cm, bottomMargin=5 * cm)
-
-            styles = getSampleStyleSheet()
-            styles.add(
-                ParagraphStyle(name='TituloPrincipal', parent=styles['Heading1'], alignment=TA_CENTER, fontSize=15,
-                               spaceAfter=12))
-            styles.add(ParagraphStyle(name='Subtitulo', parent=styles['Heading2'], alignment=TA_CENTER, fontSize=14,
-                                      spaceAfter=6))
-            styles.add(
-                ParagraphStyle(name='Inform', fontName='Helvetica', fontSize=13, leading=14, alignment=TA_LEFT))
-            styles.add(ParagraphStyle(name='CheckInfo', parent=styles['Inform'], leftIndent=1 * cm))
-
-            styles.add(
-                ParagraphStyle(name='NormalFix', fontName='Helvetica', fontSize=11, leading=14, alignment=TA_LEFT))
-            styles.add(ParagraphStyle(name='Checkbox', parent=styles['NormalFix'], leftIndent=1 * cm))
-
-            # Máscara para o CPF (ex: 123.***.***-34)
-            cpf_limpo = re.sub(r'\D', '', servico['cpf'])
-            cpf_mascarado = f"{cpf_limpo[:3]}.***.***-{cpf_limpo[-2:]}"
-
-            elements = []
-            elements.append(
-                Paragraph(f"SOLICITAÇÃO DE SERVIÇO DE VACOL - Protocolo nº {servico['id']}", styles['TituloPrincipal']))
-            data_solicitacao = datetime.strptime(servico['data_solicitacao'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
-            elements.append(Paragraph(f"Serviço Solicitado em {data_solicitacao}", styles['Subtitulo']))
-            elements.append(Spacer(1, 0.5 * cm))
-
-            elements.append(Paragraph(f"<b>CPF:</b> {cpf_mascarado}", styles['Inform']))
-            elements.append(Paragraph(f"<b>Nome:</b> {servico['nome']}", styles['Inform']))
-            elements.append(Paragraph(f"<b>Tel/Cel:</b> {servico['telefone']}", styles['Inform']))
-            elements.append(Paragraph(f"<b>Bairro:</b> {servico['bairro']}", styles['Inform']))
-            elements.append(
-                Paragraph(f"<b>Endereço:</b> {servico['rua']}, Nº: {servico['numero']}", styles['Inform']))
-            elements.append(Paragraph(f"<b>QD:</b> {servico['quadra'] or ''}   <b>LT:</b> {servico['lote'] or ''}",
-                                      styles['Inform']))
-            elements.append(Paragraph(f"<b>Referência:</b> {servico['referencia'] or ''}", styles['Inform']))
-            elements.append(Paragraph(f"<b>Nº de Fossas:</b> {servico['numero_fossas'] or ''}", styles['Inform']))
-            elements.append(Spacer(1, 0.8 * cm))
-
-            chegada = servico.get('data_chegada') or '____:____'
-            saida = servico.get('data_saida') or '____:____'
-            conclusao = servico.get('data_conclusao') or '__/__/____'
-            elements.append(Paragraph("<b>Execução de Serviço</b>", styles['Subtitulo']))
-            elements.append(Spacer(1, 0.5 * cm))
-            elements.append(Paragraph(
-                f"<b>Chegada:</b> {chegada}     <b>Saída:</b> {saida}     <b>(Concluída em:</b> {conclusao}<b>)</b>",
-                styles['NormalFix']))
-            elements.append(Spacer(1, 0.5 * cm))
-            elements.append(Paragraph("<b>Dados da Empresa</b>", styles['Subtitulo']))
-            elements.append(Spacer(1, 0.8 * cm))
-            elements.append(Paragraph(
-                f"<b>Placa:</b> {servico.get('placa_veiculo') or '_____________'}   <b>Motorista:</b> {servico.get('motorista') or '_____________________'}   <b>Ajudante:</b> {servico.get('ajudante') or '_________________'}",
-                styles['NormalFix']))
-            elements.append(Spacer(1, 1 * cm))
-            obs = (servico.get('observacao_empresa') or (f'____________________________________________________________________________\n' +
-                   f'____________________________________________________________________________' * 4))
-            elements.append(Paragraph(f"<b>Observação:</b> {obs}", styles['NormalFix']))
-            elements.append(Spacer(1, 1 * cm))
-
-
-            # --- SEÇÃO COM CHECKBOXES ---
-            elements.append(Paragraph("<b>Situação da Residência (TESTE):</b>", styles['Subtitulo']))
-            elements.append(Spacer(1, 0.5 * cm))
-            # Altere o texto após os quadrados conforme necessário
-            elements.append(Paragraph("(_) Situação 1", styles['NormalFix']))
-            elements.append(Paragraph("(_) Situação 2", styles['NormalFix']))
-            elements.append(Paragraph("(_) Situação 3", styles['NormalFix']))
-            elements.append(Paragraph("(_) Outro Situação 4: ________________________________", styles['NormalFix']))
-            elements.append(Spacer(1, 0.5 * cm))
+            planilha = Workbook(write_only=True)
+            aba = planilha.create_sheet('Serviços')
+            aba.append(list(COLUNAS_EXPORTACAO.values()))
+            for linha in primeiro_lote:
+                aba.append(tuple(linha))
+            for lote in lotes:
+                for linha in lote:
+                    aba.append(tuple(linha))
+            planilha.save(caminho_arquivo)
+            return True
+        except Exception as e:
+            print(f"Erro ao exportar para Excel: {e}")
+            return False
+
+    def _iterar_colunas_analiticas(self, filtros, tamanho_lote):
+        """Retorna um iterador de lotes ou None se nenhum serviço atender aos filtros"""
+        colunas = [f"{COLUNAS_ANALITICAS.get(coluna, coluna)} AS {coluna}" for coluna in COLUNAS_EXPORTACAO]
+        lotes = self.database.iterar_servicos(filtros=filtros, colunas=colunas, tamanho_lote=tamanho_lote)
+        primeiro_lote = next(lotes, None)
+        if not primeiro_lote:
+            return None
+        return itertools.chain([primeiro_lote], lotes)
 
+    @instrumentacao.cronometrar('exportar_csv')
+    def exportar_csv(self, caminho_arquivo, filtros=None, compressao=None, tamanho_lote=5000):
+        """
+        Exporta para CSV (UTF-8, datas em ISO 8601) lendo o banco em lotes
+        compressao pode ser 'gzip', 'bz2' ou 'xz'; sem ela, é inferida pela extensão do arquivo
+        """
+        try:
+            if compressao is None:
+                compressao = EXTENSOES_COMPRESSAO.get(os.path.splitext(caminho_arquivo)[1].lower())
+            abrir = COMPRESSOES_CSV[compressao] if compressao else open
+            lotes = self._iterar_colunas_analiticas(filtros, tamanho_lote)
+            if lotes is None:
+                return False
 
-            doc.build(elements, onFirstPage=self._footer_callback, onLaterPages=self._footer_callback)
+            with abrir(caminho_arquivo, 'wt', encoding='utf-8', newline='') as arquivo:
+                escritor = csv.writer(arquivo)
+                escritor.writerow(list(COLUNAS_EXPORTACAO))
+                for lote in lotes:
+                    escritor.writerows(lote)
+            return True
+        except Exception as e:
+            print(f"Erro ao exportar para CSV: {e}")
+            return False
+
+    @instrumentacao.cronometrar('exportar_parquet')
+    def exportar_parquet(self, caminho_arquivo, filtros=None, compressao='snappy', tamanho_lote=50000):
+        """
+        Exporta para Parquet com colunas tipadas (id e número de fossas inteiros,
+        data de solicitação como timestamp e data de conclusão como date), gravando um row group por lote
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            tipos = {'id': pa.int64(), 'numero_fossas': pa.int32(), 'data_solicitacao': pa.timestamp('s'),
+                     'data_conclusao': pa.date32()}
+            esquema = pa.schema([(coluna, tipos.get(coluna, pa.string())) for coluna in COLUNAS_EXPORTACAO])
+            lotes = self._iterar_colunas_analiticas(filtros, tamanho_lote)
+            if lotes is None:
+                return False
+
+            with pq.ParquetWriter(caminho_arquivo, esquema, compression=compressao) as escritor:
+                for lote in lotes:
+                    colunas = {coluna: [linha[indice] for linha in lote]
+                               for indice, coluna in enumerate(COLUNAS_EXPORTACAO)}
+                    colunas['data_solicitacao'] = [self._converter_iso(valor) for valor in colunas['data_solicitacao']]
+                    colunas['data_conclusao'] = [self._converter_iso(valor, data=True)
+                                                 for valor in colunas['data_conclusao']]
+                    escritor.write_table(pa.Table.from_pydict(colunas, schema=esquema))
+            return True
+        except Exception as e:
+            print(f"Erro ao exportar para Parquet: {e}")
+            return False
+
+    @staticmethod
+    def _converter_iso(valor, data=False):
+        if not valor:
+            return None
+        try:
+            convertido = datetime.fromisoformat(valor)
+        except ValueError:
+            return None
+        return convertido.date() if data else convertido
+
+    def obter_pdf_em_cache(self, id_servico):
+        """
+        Retorna o caminho do PDF do serviço no cache, gerando-o se necessário, ou None se não existir
+        O serviço também é procurado no banco de arquivo
+        """
+        servico = self.database.obter_servico(id_servico, incluir_arquivo=True)
+        if not servico:
+            return None
+        return self.cache_pdf.obter(servico, self.modelo_pdf.renderizar)
+
+    @instrumentacao.cronometrar('gerar_pdf')
+    def gerar_pdf(self, id_servico, caminho_arquivo):
+        try:
+            caminho_cache = self.obter_pdf_em_cache(id_servico)
+            if not caminho_cache:
+                return False
+            shutil.copyfile(caminho_cache, caminho_arquivo)
             return True
         except Exception as e:
             print(f"Erro inesperado durante a geração do PDF: {e}")
             return False
 
-    def visualizar_pdf(self, id_servico):
+    @instrumentacao.cronometrar('gerar_pdfs_em_lote')
+    def gerar_pdfs_em_lote(self, destino, ids=None, filtros=None, mesclar=False, max_processos=None,
+                           callback_progresso=None):
+        """
+        Gera os PDFs de vários serviços em paralelo, em um pool de processos
+        Os serviços são escolhidos pela lista de ids (procurados também no banco de arquivo) ou,
+        se ela não for informada, pelos filtros (arquivados apenas com o filtro incluir_arquivo)
+        Sem mesclar, destino é uma pasta e cada serviço gera o arquivo OS_<protocolo>.pdf;
+        com mesclar=True, destino é o arquivo PDF único com todas as ordens (requer pypdf)
+        callback_progresso recebe (concluidos, total)
+        Retorna um dicionário com 'arquivos' gerados, 'falhas' [(id, mensagem)] e 'arquivo_mesclado'
+        """
+        resultado = {'arquivos': [], 'falhas': [], 'arquivo_mesclado': None}
+        pasta_temporaria = None
         try:
-            fd, caminho_temporario = tempfile.mkstemp(suffix='.pdf')
-            os.close(fd)
+            if ids is not None:
+                servicos = self.database.obter_servicos(ids, incluir_arquivo=True)
+                encontrados = {servico['id'] for servico in servicos}
+                resultado['falhas'].extend((id_servico, "Serviço não encontrado") for id_servico in ids
+                                           if int(id_servico) not in encontrados)
+            else:
+                servicos = [dict(linha) for lote in self.database.iterar_servicos(filtros=filtros) for linha in lote]
+            if not servicos:
+                return resultado
+
+            if mesclar:
+                pasta_temporaria = tempfile.mkdtemp(prefix='os_lote_')
+                pasta = pasta_temporaria
+            else:
+                pasta = destino
+                os.makedirs(pasta, exist_ok=True)
+
+            caminhos = {servico['id']: os.path.join(pasta, f"OS_{servico['id']}.pdf") for servico in servicos}
+            with ProcessPoolExecutor(max_workers=max_processos) as executor:
+                futuros = [executor.submit(_renderizar_pdf_processo, servico, caminhos[servico['id']])
+                           for servico in servicos]
+                for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+                    id_servico, erro = futuro.result()
+                    if erro:
+                        resultado['falhas'].append((id_servico, erro))
+                        caminhos.pop(id_servico)
+                    if callback_progresso:
+                        callback_progresso(concluidos, len(futuros))
 
-            if not self.gerar_pdf(id_servico, caminho_temporario):
+            # Mantém a ordem em que os serviços foram selecionados
+            arquivos = [caminhos[servico['id']] for servico in servicos if servico['id'] in caminhos]
+            if mesclar:
+                if arquivos:
+                    from pypdf import PdfWriter
+
+                    escritor = PdfWriter()
+                    for arquivo in arquivos:
+                        escritor.append(arquivo)
+                    with open(destino, 'wb') as saida:
+                        escritor.write(saida)
+                    resultado['arquivo_mesclado'] = destino
+            else:
+                resultado['arquivos'] = arquivos
+        except Exception as e:
+            print(f"Erro ao gerar PDFs em lote: {e}")
+            resultado['falhas'].append((None, str(e)))
+        finally:
+            if pasta_temporaria:
+                shutil.rmtree(pasta_temporaria, ignore_errors=True)
+        return resultado
+
+    @instrumentacao.cronometrar('visualizar_pdf')
+    def visualizar_pdf(self, id_servico):
+        try:
+            caminho_pdf = self.obter_pdf_em_cache(id_servico)
+            if not caminho_pdf:
                 return False
 
             if os.name == 'nt':  # Windows
-                os.startfile(caminho_temporario)
+                os.startfile(caminho_pdf)
             else:  # Linux, macOS
-                os.system(f'xdg-open "{caminho_temporario}"')
+                os.system(f'xdg-open "{caminho_pdf}"')
 
             return True
         except Exception as e:
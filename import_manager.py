@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+import os
+import csv
+from datetime import datetime
+from database import chave_endereco, normalizar_texto, normalizar_data_solicitacao
+from export_manager import COLUNAS_EXPORTACAO
+
+
+class ImportManager:
+    """
+    Importa ordens de serviço de planilhas CSV/XLSX recebidas de outros escritórios.
+    As linhas são lidas em fluxo (geradores), validadas e gravadas em lotes, sem
+    carregar o arquivo inteiro na memória.
+    """
+    def __init__(self, database):
+        self.database = database
+        # Aceita tanto os cabeçalhos da exportação ("Nome", "Data Solicitação"...) quanto os nomes das colunas
+        self.mapa_cabecalhos = {}
+        for coluna, cabecalho in COLUNAS_EXPORTACAO.items():
+            self.mapa_cabecalhos[normalizar_texto(cabecalho)] = coluna
+            self.mapa_cabecalhos[normalizar_texto(coluna)] = coluna
+
+    def importar(self, caminho_arquivo, callback_progresso=None, tamanho_lote=500, pular_duplicados=True):
+        """
+        Importa o arquivo informado
+        callback_progresso recebe o percentual lido do arquivo (0 a 100)
+        Com pular_duplicados=True, linhas cujo endereço já existe (no banco ou no próprio arquivo)
+        não são gravadas e ficam listadas em 'duplicados'
+        Retorna um dicionário com 'inseridos', 'duplicados' [(linha, protocolo)] e 'erros' [(linha, mensagem)]
+        """
+        resumo = {'inseridos': 0, 'duplicados': [], 'erros': []}
+        try:
+            linhas = self._ler_arquivo(caminho_arquivo)
+            registros = self._mapear_colunas(linhas, resumo)
+            enderecos_no_arquivo = {}
+
+            for lote, progresso in self._agrupar_lotes(registros, tamanho_lote):
+                if pular_duplicados:
+                    lote = self._remover_duplicados(lote, enderecos_no_arquivo, resumo)
+
+                ids, erros = self.database.inserir_servicos_em_lote((dados for _, dados in lote),
+                                                                    tamanho_lote=tamanho_lote)
+                resumo['inseridos'] += sum(1 for id_servico in ids if id_servico is not None)
+                resumo['erros'].extend((lote[indice][0], mensagem) for indice, mensagem in erros)
+                if pular_duplicados:
+                    for (_, dados), id_servico in zip(lote, ids):
+                        if id_servico is not None:
+                            enderecos_no_arquivo[self._chave(dados)] = id_servico
+                        else:
+                            enderecos_no_arquivo.pop(self._chave(dados), None)
+
+                if callback_progresso:
+                    callback_progresso(progresso)
+        except Exception as e:
+            print(f"Erro ao importar planilha: {e}")
+            resumo['erros'].append((None, str(e)))
+        return resumo
+
+    def _ler_arquivo(self, caminho_arquivo):
+        extensao = os.path.splitext(caminho_arquivo)[1].lower()
+        if extensao in ('.xlsx', '.xlsm'):
+            return self._ler_xlsx(caminho_arquivo)
+        if extensao in ('.csv', '.txt'):
+            return self._ler_csv(caminho_arquivo)
+        raise ValueError(f"Formato de arquivo não suportado: {extensao}")
+
+    def _ler_csv(self, caminho_arquivo):
+        """Gera (numero_linha, valores, progresso) lendo o CSV linha a linha"""
+        tamanho = os.path.getsize(caminho_arquivo) or 1
+        with open(caminho_arquivo, 'rb') as arquivo:
+            inicio = arquivo.read(4096).decode('utf-8-sig', errors='ignore')
+            arquivo.seek(0)
+            try:
+                dialeto = csv.Sniffer().sniff(inicio, delimiters=';,\t')
+            except csv.Error:
+                dialeto = csv.excel
+            lidos = [0]
+            codificacao = ['utf-8-sig']
+
+            def linhas_texto():
+                for linha in arquivo:
+                    lidos[0] += len(linha)
+                    try:
+                        yield linha.decode(codificacao[0])
+                    except UnicodeDecodeError:
+                        # CSV salvo pelo Excel em português (Windows-1252): o restante do arquivo segue nela
+                        codificacao[0] = 'cp1252'
+                        yield linha.decode('cp1252', errors='replace')
+
+            for numero_linha, valores in enumerate(csv.reader(linhas_texto(), dialeto), start=1):
+                yield numero_linha, valores, 100.0 * lidos[0] / tamanho
+
+    def _ler_xlsx(self, caminho_arquivo):
+        """Gera (numero_linha, valores, progresso) lendo a planilha em modo somente leitura"""
+        from openpyxl import load_workbook
+
+        planilha = load_workbook(caminho_arquivo, read_only=True, data_only=True)
+        try:
+            aba = planilha['Serviços'] if 'Serviços' in planilha.sheetnames else planilha.active
+            total = aba.max_row or 1
+            for numero_linha, valores in enumerate(aba.iter_rows(values_only=True), start=1):
+                yield numero_linha, valores, 100.0 * numero_linha / total
+        finally:
+            planilha.close()
+
+    def _mapear_colunas(self, linhas, resumo):
+        """
+        Converte as linhas da planilha em dicionários com os nomes das colunas do banco
+        Linhas com valores inválidos não são gravadas e ficam listadas em resumo['erros']
+        """
+        colunas = None
+        for numero_linha, valores, progresso in linhas:
+            if colunas is None:
+                colunas = [self.mapa_cabecalhos.get(normalizar_texto(cabecalho)) for cabecalho in valores]
+                continue
+
+            dados = {}
+            try:
+                for coluna, valor in zip(colunas, valores):
+                    # O protocolo é sempre gerado pelo banco de destino
+                    if coluna is None or coluna == 'id':
+                        continue
+                    dados[coluna] = self._converter_valor(coluna, valor)
+            except ValueError as e:
+                resumo['erros'].append((numero_linha, str(e)))
+                continue
+            if any(valor is not None for valor in dados.values()):
+                yield numero_linha, dados, progresso
+
+    @staticmethod
+    def _converter_valor(coluna, valor):
+        if isinstance(valor, datetime):
+            return normalizar_data_solicitacao(valor) if coluna == 'data_solicitacao' else valor.strftime('%d/%m/%Y')
+        if valor is None:
+            return None
+        valor = str(valor).strip()
+        if not valor:
+            return None
+        if coluna == 'numero_fossas':
+            try:
+                return int(float(valor))
+            except ValueError:
+                return None
+        if coluna == 'data_solicitacao':
+            return normalizar_data_solicitacao(valor)
+        return valor
+
+    @staticmethod
+    def _agrupar_lotes(registros, tamanho_lote):
+        """Agrupa os registros em lotes, informando o progresso da leitura ao fim de cada lote"""
+        lote = []
+        for numero_linha, dados, progresso in registros:
+            lote.append((numero_linha, dados))
+            if len(lote) >= tamanho_lote:
+                yield lote, progresso
+                lote = []
+        yield lote, 100.0
+
+    @staticmethod
+    def _chave(dados):
+        return chave_endereco(dados.get('bairro'), dados.get('rua'), dados.get('numero'),
+                              dados.get('quadra'), dados.get('lote'))
+
+    def _remover_duplicados(self, lote, enderecos_no_arquivo, resumo):
+        """Remove do lote os endereços já cadastrados, consultando o banco uma vez por lote"""
+        chaves = [self._chave(dados) for _, dados in lote]
+        existentes = self.database.verificar_enderecos_duplicados(chaves)
+        restantes = []
+        for (numero_linha, dados), chave in zip(lote, chaves):
+            if chave in existentes:
+                resumo['duplicados'].append((numero_linha, existentes[chave]))
+            elif chave in enderecos_no_arquivo:
+                # Endereço repetido no próprio arquivo (sem protocolo se ainda estiver no mesmo lote)
+                resumo['duplicados'].append((numero_linha, enderecos_no_arquivo[chave]))
+            else:
+                enderecos_no_arquivo[chave] = None
+                restantes.append((numero_linha, dados))
+        return restantes
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentação das consultas SQL e das operações de exportação.
+
+Desativada por padrão: as conexões do pool só passam a usar o cursor instrumentado depois
+de instrumentacao.ativar(). Também pode ser ligada pelas variáveis de ambiente:
+    SERVICOS_INSTRUMENTACAO=1         ativa a instrumentação
+    SERVICOS_LIMITE_LENTO_MS=100      limite para o log de consultas lentas
+    SERVICOS_LOG_LENTO=lentas.jsonl   arquivo do log de consultas lentas (uma linha JSON por consulta)
+    SERVICOS_ESTATISTICAS=stats.json  arquivo onde as estatísticas são gravadas ao encerrar
+"""
+import os
+import json
+import time
+import atexit
+import sqlite3
+import threading
+import functools
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Limites (ms) das faixas do histograma de latência; a última faixa acumula o que passar de 1s
+LIMITES_HISTOGRAMA_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+# Comandos que não passam pelo EXPLAIN QUERY PLAN
+COMANDOS_SEM_PLANO = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'PRAGMA', 'CREATE', 'ALTER',
+                      'DROP', 'ANALYZE', 'VACUUM', 'ATTACH', 'DETACH', 'EXPLAIN')
+
+
+def _faixas():
+    return [f"<={limite}ms" for limite in LIMITES_HISTOGRAMA_MS] + [f">{LIMITES_HISTOGRAMA_MS[-1]}ms"]
+
+
+class _Estatistica:
+    __slots__ = ('chamadas', 'erros', 'total_ms', 'max_ms', 'leitura_ms', 'linhas', 'histograma')
+
+    def __init__(self):
+        self.chamadas = 0
+        self.erros = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.leitura_ms = 0.0
+        self.linhas = 0
+        self.histograma = [0] * (len(LIMITES_HISTOGRAMA_MS) + 1)
+
+    def registrar(self, duracao_ms, erro=False):
+        self.chamadas += 1
+        self.erros += erro
+        self.total_ms += duracao_ms
+        self.max_ms = max(self.max_ms, duracao_ms)
+        self.histograma[bisect_left(LIMITES_HISTOGRAMA_MS, duracao_ms)] += 1
+
+    def como_dict(self):
+        return {
+            'chamadas': self.chamadas, 'erros': self.erros, 'total_ms': round(self.total_ms, 3),
+            'media_ms': round(self.total_ms / self.chamadas, 3) if self.chamadas else 0.0,
+            'max_ms': round(self.max_ms, 3), 'leitura_ms': round(self.leitura_ms, 3), 'linhas': self.linhas,
+            'histograma': dict(zip(_faixas(), self.histograma)),
+        }
+
+
+class Instrumentacao:
+    """Coleta as estatísticas por comando SQL e por operação, e o log de consultas lentas"""
+    def __init__(self):
+        self.ativa = False
+        self.limite_lento_ms = 100.0
+        self.arquivo_lento = None
+        self._lock = threading.Lock()
+        self._consultas = {}
+        self._operacoes = {}
+        self._lentas = deque(maxlen=200)
+
+    def ativar(self, limite_lento_ms=None, arquivo_lento=None):
+        if limite_lento_ms is not None:
+            self.limite_lento_ms = float(limite_lento_ms)
+        if arquivo_lento is not None:
+            self.arquivo_lento = arquivo_lento
+        self.ativa = True
+
+    def desativar(self):
+        self.ativa = False
+
+    def limpar(self):
+        with self._lock:
+            self._consultas.clear()
+            self._operacoes.clear()
+            self._lentas.clear()
+
+    @staticmethod
+    def _normalizar_sql(sql):
+        return ' '.join(sql.split())
+
+    def registrar_consulta(self, conexao, sql, parametros, duracao_ms, linhas=0, erro=False, leitura_ms=0.0):
+        """
+        Registra uma execução do comando: duracao_ms é o tempo total (execute mais as leituras do resultado),
+        do qual leitura_ms foi gasto nos fetch*; é sobre o total que vale o limite de consulta lenta
+        """
+        chave = self._normalizar_sql(sql)
+        with self._lock:
+            estatistica = self._consultas.get(chave)
+            if estatistica is None:
+                estatistica = self._consultas[chave] = _Estatistica()
+            estatistica.registrar(duracao_ms, erro)
+            estatistica.linhas += linhas
+            estatistica.leitura_ms += leitura_ms
+        if duracao_ms >= self.limite_lento_ms and not erro:
+            self._registrar_lenta(conexao, chave, parametros, duracao_ms)
+
+    def _registrar_lenta(self, conexao, sql, parametros, duracao_ms):
+        plano = self._plano(conexao, sql, parametros)
+        registro = {
+            'data': datetime.now().isoformat(timespec='milliseconds'),
+            'duracao_ms': round(duracao_ms, 3),
+            'sql': sql,
+            'parametros': [str(parametro) for parametro in parametros] if parametros else [],
+            'plano': plano,
+            # Tabelas lidas por inteiro (sem índice) aparecem como SCAN no plano
+            'varredura_completa': any(linha.startswith('SCAN ') and 'VIRTUAL TABLE' not in linha
+                                      for linha in plano),
+        }
+        with self._lock:
+            self._lentas.append(registro)
+            if self.arquivo_lento:
+                try:
+                    with open(self.arquivo_lento, 'a', encoding='utf-8') as arquivo:
+                        arquivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+                except OSError as e:
+                    print(f"Erro ao gravar o log de consultas lentas: {e}")
+
+    @staticmethod
+    def _plano(conexao, sql, parametros):
+        if sql.split(None, 1)[0].upper() in COMANDOS_SEM_PLANO or isinstance(parametros, list) and \
+                parametros and isinstance(parametros[0], (list, tuple)):
+            return []
+        try:
+            # Cursor comum, para que o próprio EXPLAIN não seja instrumentado
+            cursor = sqlite3.Cursor(conexao)
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parametros or ())
+            return [linha[3] for linha in cursor.fetchall()]
+        except sqlite3.Error as e:
+            return [f"Plano indisponível: {e}"]
+
+    @contextmanager
+    def medir(self, nome):
+        """Mede o tempo de um bloco como a operação `nome`"""
+        if not self.ativa:
+            yield
+            return
+        inicio = time.perf_counter()
+        erro = False
+        try:
+            yield
+        except Exception:
+            erro = True
+            raise
+        finally:
+            self.registrar_operacao(nome, (time.perf_counter() - inicio) * 1000, erro)
+
+    def registrar_operacao(self, nome, duracao_ms, erro=False):
+        with self._lock:
+            estatistica = self._operacoes.get(nome)
+            if estatistica is None:
+                estatistica = self._operacoes[nome] = _Estatistica()
+            estatistica.registrar(duracao_ms, erro)
+
+    def cronometrar(self, nome):
+        """Decorador que mede cada chamada da função como a operação `nome` (retorno False conta como erro)"""
+        def decorador(funcao):
+            @functools.wraps(funcao)
+            def envolvida(*args, **kwargs):
+                if not self.ativa:
+                    return funcao(*args, **kwargs)
+                inicio = time.perf_counter()
+                resultado = False
+                try:
+                    resultado = funcao(*args, **kwargs)
+                    return resultado
+                finally:
+                    self.registrar_operacao(nome, (time.perf_counter() - inicio) * 1000, resultado is False)
+            return envolvida
+        return decorador
+
+    def estatisticas(self, ordenar_por='total_ms'):
+        """
+        Retorna as estatísticas coletadas: consultas (por comando SQL, da mais custosa para a menos),
+        operações e as últimas consultas lentas
+        """
+        with self._lock:
+            consultas = [dict(estatistica.como_dict(), sql=sql) for sql, estatistica in self._consultas.items()]
+            operacoes = {nome: estatistica.como_dict() for nome, estatistica in self._operacoes.items()}
+            lentas = list(self._lentas)
+        consultas.sort(key=lambda consulta: consulta[ordenar_por], reverse=True)
+        return {'limite_lento_ms': self.limite_lento_ms, 'consultas': consultas, 'operacoes': operacoes,
+                'lentas': lentas}
+
+    def salvar(self, caminho_arquivo):
+        """Grava as estatísticas em um arquivo JSON"""
+        try:
+            with open(caminho_arquivo, 'w', encoding='utf-8') as arquivo:
+                json.dump(self.estatisticas(), arquivo, ensure_ascii=False, indent=2)
+            return True
+        except OSError as e:
+            print(f"Erro ao gravar as estatísticas: {e}")
+            return False
+
+
+instrumentacao = Instrumentacao()
+
+
+class CursorInstrumentado(sqlite3.Cursor):
+    """
+    Cursor que registra o tempo de cada comando e as linhas lidas na instrumentação
+    Um comando com resultado só é registrado quando o resultado termina de ser lido (ou o cursor é
+    fechado, reutilizado ou descartado), com o tempo do execute somado ao das leituras
+    """
+    # Comando com resultado ainda em leitura: [sql, parametros, execute_ms, leitura_ms, linhas]
+    _pendente = None
+
+    def _finalizar(self):
+        pendente, self._pendente = self._pendente, None
+        if pendente is not None:
+            sql, parametros, execute_ms, leitura_ms, linhas = pendente
+            instrumentacao.registrar_consulta(self.connection, sql, parametros, execute_ms + leitura_ms, linhas,
+                                              leitura_ms=leitura_ms)
+
+    def execute(self, sql, parametros=()):
+        self._finalizar()
+        inicio = time.perf_counter()
+        try:
+            super().execute(sql, parametros)
+        except Exception:
+            instrumentacao.registrar_consulta(self.connection, sql, parametros,
+                                              (time.perf_counter() - inicio) * 1000, erro=True)
+            raise
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+        if self.description is None:
+            # Comandos sem resultado (INSERT, UPDATE...) contam as linhas afetadas
+            instrumentacao.registrar_consulta(self.connection, sql, parametros, duracao_ms, max(self.rowcount, 0))
+        else:
+            self._pendente = [sql, parametros, duracao_ms, 0.0, 0]
+        return self
+
+    def executemany(self, sql, sequencia_parametros):
+        self._finalizar()
+        sequencia_parametros = list(sequencia_parametros)
+        inicio = time.perf_counter()
+        try:
+            super().executemany(sql, sequencia_parametros)
+        except Exception:
+            instrumentacao.registrar_consulta(self.connection, sql, sequencia_parametros,
+                                              (time.perf_counter() - inicio) * 1000, erro=True)
+            raise
+        instrumentacao.registrar_consulta(self.connection, sql, sequencia_parametros,
+                                          (time.perf_counter() - inicio) * 1000, max(self.rowcount, 0))
+        return self
+
+    def _ler(self, leitura, *args, **kwargs):
+        inicio = time.perf_counter()
+        resultado = leitura(*args, **kwargs)
+        pendente = self._pendente
+        if pendente is not None:
+            pendente[3] += (time.perf_counter() - inicio) * 1000
+            pendente[4] += len(resultado) if isinstance(resultado, list) else int(resultado is not None)
+        return resultado
+
+    def fetchone(self):
+        linha = self._ler(super().fetchone)
+        if linha is None:
+            self._finalizar()
+        return linha
+
+    def fetchmany(self, size=None):
+        tamanho = self.arraysize if size is None else size
+        linhas = self._ler(super().fetchmany, tamanho)
+        # Menos linhas que o pedido: o resultado acabou
+        if len(linhas) < tamanho:
+            self._finalizar()
+        return linhas
+
+    def fetchall(self):
+        linhas = self._ler(super().fetchall)
+        self._finalizar()
+        return linhas
+
+    def __next__(self):
+        try:
+            return self._ler(super().__next__)
+        except StopIteration:
+            self._finalizar()
+            raise
+
+    def close(self):
+        self._finalizar()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finalizar()
+        except Exception:
+            pass
+
+
+class ConexaoInstrumentada(sqlite3.Connection):
+    """
+    Conexão usada pelo pool: com a instrumentação desativada, cursor() e execute() se comportam como o padrão;
+    ativada, os cursores (inclusive os de conn.execute) passam a ser instrumentados
+    """
+    def cursor(self, factory=None):
+        if factory is None and instrumentacao.ativa:
+            factory = CursorInstrumentado
+        return super().cursor(factory) if factory is not None else super().cursor()
+
+    # Connection.execute cria o cursor internamente, sem passar por cursor()
+    def execute(self, sql, parametros=()):
+        if instrumentacao.ativa:
+            return self.cursor().execute(sql, parametros)
+        return super().execute(sql, parametros)
+
+    def executemany(self, sql, sequencia_parametros):
+        if instrumentacao.ativa:
+            return self.cursor().executemany(sql, sequencia_parametros)
+        return super().executemany(sql, sequencia_parametros)
+
+
+def _configurar_pelo_ambiente():
+    if os.environ.get('SERVICOS_INSTRUMENTACAO', '').lower() not in ('1', 'true', 'sim'):
+        return
+    instrumentacao.ativar(limite_lento_ms=os.environ.get('SERVICOS_LIMITE_LENTO_MS'),
+                          arquivo_lento=os.environ.get('SERVICOS_LOG_LENTO'))
+    arquivo_estatisticas = os.environ.get('SERVICOS_ESTATISTICAS')
+    if arquivo_estatisticas:
+        atexit.register(instrumentacao.salvar, arquivo_estatisticas)
+
+
+_configurar_pelo_ambiente()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+
+
+class ListaVirtual:
+    """
+    Exibe a lista de serviços em um Treeview com rolagem contínua.
+    Só existem itens para as linhas visíveis: ao rolar, os mesmos itens recebem novos valores.
+    As linhas são buscadas em janelas de `tamanho_janela` registros ao redor da posição atual,
+    e a janela seguinte é pré-carregada em segundo plano.
+    """
+    PREFIXO_ITEM = 'linha_virtual_'
+
+    def __init__(self, tabela, scrollbar, database, tarefas, formatar_linha, tamanho_janela=200,
+                 max_janelas=8, altura_linha=20):
+        self.tabela = tabela
+        self.scrollbar = scrollbar
+        self.database = database
+        self.tarefas = tarefas
+        self.formatar_linha = formatar_linha
+        self.tamanho_janela = tamanho_janela
+        self.max_janelas = max_janelas
+        self.altura_linha = altura_linha
+
+        self.ativa = False
+        self.filtros = {}
+        self.total = 0
+        self.inicio = 0
+        self.itens = []
+        self.janelas = OrderedDict()
+        self.janelas_pendentes = set()
+        self.ids_selecionados = set()
+        self._binds = []
+        # Incrementada a cada recarga: respostas de gerações anteriores são descartadas
+        self.geracao = 0
+
+    def ativar(self):
+        self.ativa = True
+        for item in self.tabela.get_children():
+            self.tabela.delete(item)
+        self.itens = []
+        self.scrollbar.configure(command=self.rolar)
+        self.tabela.configure(yscrollcommand=lambda *args: None)
+        self._binds = [
+            ("<Configure>", self.tabela.bind("<Configure>", lambda e: self._renderizar(), add="+")),
+            ("<MouseWheel>", self.tabela.bind("<MouseWheel>", self._roda_mouse)),
+            ("<Button-4>", self.tabela.bind("<Button-4>", lambda e: self.rolar('scroll', -3, 'units'))),
+            ("<Button-5>", self.tabela.bind("<Button-5>", lambda e: self.rolar('scroll', 3, 'units'))),
+            ("<<TreeviewSelect>>", self.tabela.bind("<<TreeviewSelect>>", self._guardar_selecao, add="+")),
+        ]
+
+    def desativar(self):
+        self.ativa = False
+        self.geracao += 1
+        for evento, funcao in self._binds:
+            self.tabela.unbind(evento, funcao)
+        self._binds = []
+        for item in self.itens:
+            self.tabela.delete(item)
+        self.itens = []
+        self.janelas.clear()
+        self.scrollbar.configure(command=self.tabela.yview)
+        self.tabela.configure(yscrollcommand=self.scrollbar.set)
+
+    def recarregar(self, filtros, manter_posicao=False):
+        """Descarta as janelas em memória e recarrega a lista com os filtros informados"""
+        self.geracao += 1
+        self.filtros = dict(filtros)
+        self.janelas.clear()
+        self.janelas_pendentes.clear()
+        if not manter_posicao:
+            self.inicio = 0
+            self.ids_selecionados.clear()
+        geracao = self.geracao
+        self.tarefas.executar(self.database.contar_servicos, self.filtros,
+                              callback=lambda total: self._receber_total(geracao, total))
+
+    def _receber_total(self, geracao, total):
+        if geracao != self.geracao:
+            return
+        self.total = total
+        self.inicio = max(0, min(self.inicio, self.total - self._linhas_visiveis()))
+        self._renderizar()
+
+    def atualizar_servico(self, servico):
+        """Substitui o serviço nas janelas em memória e redesenha, sem recarregar a lista"""
+        for linhas in self.janelas.values():
+            for posicao, linha in enumerate(linhas):
+                if linha['id'] == servico['id']:
+                    linhas[posicao] = servico
+                    self._renderizar()
+                    return
+
+    def _linhas_visiveis(self):
+        altura = self.tabela.winfo_height()
+        if altura <= 1:
+            return int(self.tabela.cget('height'))
+        # Desconta a linha dos cabeçalhos
+        return max(1, altura // self.altura_linha - 1)
+
+    def rolar(self, acao, quantidade=None, unidade=None):
+        """Comando da barra de rolagem (mesma assinatura de Treeview.yview)"""
+        visiveis = self._linhas_visiveis()
+        if acao == 'moveto':
+            inicio = int(float(quantidade) * self.total)
+        elif unidade == 'pages':
+            inicio = self.inicio + int(quantidade) * visiveis
+        else:
+            inicio = self.inicio + int(quantidade)
+        self.inicio = max(0, min(inicio, self.total - visiveis))
+        self._renderizar()
+
+    def _roda_mouse(self, event):
+        self.rolar('scroll', -3 if event.delta > 0 else 3, 'units')
+        return "break"
+
+    def _guardar_selecao(self, event=None):
+        # Os itens são reaproveitados: a seleção é guardada pelo protocolo, preservando a de linhas fora da tela
+        visiveis = {str(self.tabela.item(item, "values")[0]) for item in self.itens if self.tabela.item(item, "values")}
+        selecionados = {str(self.tabela.item(item, "values")[0]) for item in self.tabela.selection()
+                        if self.tabela.item(item, "values")}
+        self.ids_selecionados = (self.ids_selecionados - visiveis) | selecionados
+
+    def _ajustar_itens(self, quantidade):
+        while len(self.itens) < quantidade:
+            item = f"{self.PREFIXO_ITEM}{len(self.itens)}"
+            self.tabela.insert("", "end", iid=item, values=())
+            self.itens.append(item)
+        while len(self.itens) > quantidade:
+            self.tabela.delete(self.itens.pop())
+
+    def _linha(self, indice):
+        """Retorna o serviço na posição indice, ou None se a janela ainda não foi carregada"""
+        janela = indice // self.tamanho_janela
+        linhas = self.janelas.get(janela)
+        if linhas is None:
+            self._carregar_janela(janela)
+            return None
+        self.janelas.move_to_end(janela)
+        posicao = indice - janela * self.tamanho_janela
+        return linhas[posicao] if posicao < len(linhas) else None
+
+    def _renderizar(self):
+        if not self.ativa:
+            return
+        visiveis = min(self._linhas_visiveis(), max(0, self.total - self.inicio))
+        self._ajustar_itens(visiveis)
+
+        selecionar = []
+        for deslocamento, item in enumerate(self.itens):
+            servico = self._linha(self.inicio + deslocamento)
+            if servico is None:
+                self.tabela.item(item, values=("", "Carregando..."))
+                continue
+            self.tabela.item(item, values=self.formatar_linha(servico))
+            if str(servico['id']) in self.ids_selecionados:
+                selecionar.append(item)
+        self.tabela.selection_set(selecionar)
+
+        # Pré-carrega a janela seguinte à área visível
+        proxima = (self.inicio + max(visiveis, 1) - 1) // self.tamanho_janela + 1
+        if proxima * self.tamanho_janela < self.total:
+            self._carregar_janela(proxima)
+
+        if self.total:
+            self.scrollbar.set(self.inicio / self.total, (self.inicio + visiveis) / self.total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _carregar_janela(self, janela):
+        if janela in self.janelas or janela in self.janelas_pendentes:
+            return
+        self.janelas_pendentes.add(janela)
+
+        # Com a janela anterior em memória, a busca parte da última linha dela (keyset) em vez de usar OFFSET
+        anterior = self.janelas.get(janela - 1)
+        apos = None
+        if anterior and len(anterior) == self.tamanho_janela:
+            apos = (anterior[-1]['data_solicitacao'], anterior[-1]['id'])
+
+        geracao = self.geracao
+        self.tarefas.executar(
+            self.database.listar_servicos_janela, filtros=self.filtros,
+            deslocamento=janela * self.tamanho_janela, limite=self.tamanho_janela, apos=apos,
+            callback=lambda linhas: self._receber_janela(geracao, janela, linhas))
+
+    def _receber_janela(self, geracao, janela, linhas):
+        if geracao != self.geracao:
+            return
+        self.janelas_pendentes.discard(janela)
+        self.janelas[janela] = linhas
+        while len(self.janelas) > self.max_janelas:
+            self.janelas.popitem(last=False)
+        self._renderizar()
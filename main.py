@@ -1,51 +1,58 @@
 # -*- coding: utf-8 -*-
+import time
+
+INICIO_PROCESSO = time.perf_counter()
+
 import os
+import argparse
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-import threading
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import tempfile
-from database import Database
+from database import Database, ConflitoAtualizacao
 from export_manager import ExportManager
+from import_manager import ImportManager
+from tarefas import ExecutorTarefas
+from lista_virtual import ListaVirtual
+from cache import CacheConsultas
 from validate_docbr import CPF
-from datetime import datetime
 import re
 
-
-# Cache simples para consultas frequentes
-class SimpleCache:
-    def __init__(self, max_size=100):
-        self.cache = {}
-        self.max_size = max_size
-
-    def get(self, key):
-        return self.cache.get(key)
-
-    def set(self, key, value):
-        if len(self.cache) >= self.max_size:
-            self.cache.pop(next(iter(self.cache)))
-        self.cache[key] = value
-
-    def clear(self):
-        self.cache.clear()
+MENSAGEM_SOMENTE_LEITURA = "Serviço não encontrado. Serviços arquivados não podem ser alterados nem excluídos."
 
 
 class CRUDApp:
-    def __init__(self, root):
+    def __init__(self, root, medir_inicializacao=False, aquecer_exportacao=True):
+        self.medir_inicializacao = medir_inicializacao
+        self.aquecer_exportacao = aquecer_exportacao
+        self._marcos_inicializacao = [('imports', time.perf_counter())]
+        self._primeira_pagina_exibida = False
         self.root = root
         self.root.title("Sistema de Cadastro de Serviços")
         self.root.geometry("1200x700")
         self.root.minsize(1000, 600)
 
-        self.db = Database()
+        # Índices, busca textual e resumos só são verificados depois que a primeira página aparece
+        self.db = Database(inicializacao_adiada=True)
+        self._marcar_inicializacao('banco')
         self.export_manager = ExportManager(self.db)
+        self.import_manager = ImportManager(self.db)
         self.cpf_validator = CPF()
-        self.cache = SimpleCache()
+        self.cache = CacheConsultas(self.db)
+        self.tarefas = ExecutorTarefas(self.root, ao_erro=self._erro_tarefa)
+        self._tarefa_lista = None
         self.endereco_duplicado_id = None
         self.confirmar_duplicidade = False
+        self.servico_original = None
         self.pagina_atual = 1
         self.itens_por_pagina = 20
         self.total_registros = 0
         self.filtros = {}
+        self.token_pagina = None
+        self.ultima_pagina = False
+        self.token_anterior = None
+        self.token_proximo = None
+        self.atraso_filtro_ms = 300
+        self._filtro_agendado = None
 
         self.style = ttk.Style()
         self.style.configure("TFrame", background="#f0f0f0")
@@ -59,14 +66,51 @@ class CRUDApp:
 
         self.tab_lista = ttk.Frame(self.notebook)
         self.tab_cadastro = ttk.Frame(self.notebook)
+        self.tab_painel = ttk.Frame(self.notebook)
 
         self.notebook.add(self.tab_lista, text="Lista de Serviços")
         self.notebook.add(self.tab_cadastro, text="Cadastro de Serviço")
+        self.notebook.add(self.tab_painel, text="Painel")
 
         self.setup_lista_tab()
         self.setup_cadastro_tab()
+        self.setup_painel_tab()
+        self.root.protocol("WM_DELETE_WINDOW", self.fechar)
+        self._marcar_inicializacao('janela')
         self.carregar_servicos()
 
+    def _marcar_inicializacao(self, etapa):
+        self._marcos_inicializacao.append((etapa, time.perf_counter()))
+
+    def _concluir_inicializacao(self):
+        """Executa, em segundo plano, o que não é necessário para exibir a primeira página"""
+        self._marcar_inicializacao('primeira_pagina')
+        self.tarefas.executar(self.db.concluir_inicializacao, callback=self._inicializacao_adiada_concluida)
+
+    def _inicializacao_adiada_concluida(self, _):
+        self._marcar_inicializacao('inicializacao_adiada')
+        if self.aquecer_exportacao:
+            self.tarefas.executar(self.export_manager.aquecer, callback=self._aquecimento_concluido)
+        else:
+            self._aquecimento_concluido(None)
+
+    def _aquecimento_concluido(self, _):
+        self._marcar_inicializacao('aquecimento_exportacao')
+        if self.medir_inicializacao:
+            anterior = INICIO_PROCESSO
+            print("Tempos de inicialização (desde o início do processo):")
+            for etapa, instante in self._marcos_inicializacao:
+                print(f"  {etapa:<24} {instante - INICIO_PROCESSO:8.3f}s  (+{instante - anterior:.3f}s)")
+                anterior = instante
+            self.fechar()
+
+    def fechar(self):
+        # Espera um pouco pelas tarefas em execução; as que passarem disso têm a conexão fechada ao terminar
+        self.tarefas.encerrar(timeout=2.0)
+        # Roda o PRAGMA optimize e fecha as conexões do pool
+        self.db.fechar()
+        self.root.destroy()
+
     def setup_lista_tab(self):
         frame_topo = ttk.Frame(self.tab_lista)
         frame_topo.pack(fill=tk.X, padx=10, pady=10)
@@ -76,6 +120,12 @@ class CRUDApp:
         frame_botoes_topo.pack(side=tk.LEFT)
         ttk.Button(frame_botoes_topo, text="Novo Serviço", command=self.novo_servico).pack(side=tk.LEFT, padx=5)
         ttk.Button(frame_botoes_topo, text="Exportar Excel", command=self.exportar_excel).pack(side=tk.LEFT, padx=5)
+        ttk.Button(frame_botoes_topo, text="Exportar CSV/Parquet", command=self.exportar_dados).pack(side=tk.LEFT,
+                                                                                                    padx=5)
+        ttk.Button(frame_botoes_topo, text="Importar Planilha", command=self.importar_planilha).pack(side=tk.LEFT,
+                                                                                                     padx=5)
+        ttk.Button(frame_botoes_topo, text="Arquivar Antigos", command=self.arquivar_servicos).pack(side=tk.LEFT,
+                                                                                                    padx=5)
 
         frame_filtros = ttk.LabelFrame(self.tab_lista, text="Filtros")
         frame_filtros.pack(fill=tk.X, padx=10, pady=5)
@@ -103,6 +153,35 @@ class CRUDApp:
         ttk.Button(filtro_frame2, text="Filtrar", command=self.aplicar_filtros).pack(side=tk.LEFT, padx=5)
         ttk.Button(filtro_frame2, text="Limpar Filtros", command=self.limpar_filtros).pack(side=tk.LEFT, padx=5)
 
+        filtro_frame3 = ttk.Frame(frame_filtros)
+        filtro_frame3.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(filtro_frame3, text="Solicitação de:").pack(side=tk.LEFT, padx=5)
+        self.filtro_solicitacao_de = ttk.Entry(filtro_frame3, width=12)
+        self.filtro_solicitacao_de.pack(side=tk.LEFT, padx=5)
+        ttk.Label(filtro_frame3, text="até:").pack(side=tk.LEFT, padx=5)
+        self.filtro_solicitacao_ate = ttk.Entry(filtro_frame3, width=12)
+        self.filtro_solicitacao_ate.pack(side=tk.LEFT, padx=5)
+        ttk.Label(filtro_frame3, text="Conclusão de:").pack(side=tk.LEFT, padx=5)
+        self.filtro_conclusao_de = ttk.Entry(filtro_frame3, width=12)
+        self.filtro_conclusao_de.pack(side=tk.LEFT, padx=5)
+        ttk.Label(filtro_frame3, text="até:").pack(side=tk.LEFT, padx=5)
+        self.filtro_conclusao_ate = ttk.Entry(filtro_frame3, width=12)
+        self.filtro_conclusao_ate.pack(side=tk.LEFT, padx=5)
+        ttk.Label(filtro_frame3, text="(DD/MM/AAAA)").pack(side=tk.LEFT, padx=5)
+        self.filtro_incluir_arquivo = tk.BooleanVar(value=False)
+        ttk.Checkbutton(filtro_frame3, text="Incluir arquivados", variable=self.filtro_incluir_arquivo,
+                        command=self.aplicar_filtros).pack(side=tk.LEFT, padx=10)
+        self.filtros_data = {
+            'solicitacao_de': self.filtro_solicitacao_de, 'solicitacao_ate': self.filtro_solicitacao_ate,
+            'conclusao_de': self.filtro_conclusao_de, 'conclusao_ate': self.filtro_conclusao_ate,
+        }
+
+        # Filtragem enquanto o usuário digita
+        for campo in (self.filtro_nome, self.filtro_cpf, self.filtro_bairro, self.filtro_rua, self.filtro_status,
+                      *self.filtros_data.values()):
+            campo.bind("<KeyRelease>", self.agendar_filtros, add="+")
+        self.filtro_status.bind("<<ComboboxSelected>>", self.agendar_filtros, add="+")
+
         frame_tabela = ttk.Frame(self.tab_lista)
         frame_tabela.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         colunas = ("id", "data", "nome", "cpf", "telefone", "endereco", "status")
@@ -115,13 +194,14 @@ class CRUDApp:
             self.tabela.heading(col, text=text)
             self.tabela.column(col, width=widths[col], anchor=tk.CENTER if col in ['id', 'status'] else tk.W)
 
-        scrollbar_y = ttk.Scrollbar(frame_tabela, orient=tk.VERTICAL, command=self.tabela.yview)
+        self.scrollbar_y = ttk.Scrollbar(frame_tabela, orient=tk.VERTICAL, command=self.tabela.yview)
         scrollbar_x = ttk.Scrollbar(frame_tabela, orient=tk.HORIZONTAL, command=self.tabela.xview)
-        self.tabela.configure(yscrollcommand=scrollbar_y.set, xscrollcommand=scrollbar_x.set)
-        scrollbar_y.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tabela.configure(yscrollcommand=self.scrollbar_y.set, xscrollcommand=scrollbar_x.set)
+        self.scrollbar_y.pack(side=tk.RIGHT, fill=tk.Y)
         scrollbar_x.pack(side=tk.BOTTOM, fill=tk.X)
         self.tabela.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.tabela.bind("<Double-1>", self.abrir_servico)
+        self.lista_virtual = ListaVirtual(self.tabela, self.scrollbar_y, self.cache, self.tarefas, self._valores_linha)
 
         frame_paginacao = ttk.Frame(self.tab_lista)
         frame_paginacao.pack(fill=tk.X, padx=10, pady=5)
@@ -138,6 +218,9 @@ class CRUDApp:
         self.cb_itens_por_pagina.set("20")
         self.cb_itens_por_pagina.pack(side=tk.LEFT, padx=5)
         self.cb_itens_por_pagina.bind("<<ComboboxSelected>>", self.alterar_itens_por_pagina)
+        self.modo_rolagem_continua = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame_paginacao, text="Rolagem contínua", variable=self.modo_rolagem_continua,
+                        command=self.alternar_rolagem_continua).pack(side=tk.LEFT, padx=10)
 
         frame_acoes = ttk.Frame(self.tab_lista)
         frame_acoes.pack(fill=tk.X, padx=10, pady=10)
@@ -145,6 +228,59 @@ class CRUDApp:
         ttk.Button(frame_acoes, text="Excluir", command=self.excluir_servico).pack(side=tk.LEFT, padx=5)
         ttk.Button(frame_acoes, text="Gerar PDF", command=self.gerar_pdf).pack(side=tk.LEFT, padx=5)
         ttk.Button(frame_acoes, text="Visualizar PDF", command=self.visualizar_pdf).pack(side=tk.LEFT, padx=5)
+        ttk.Button(frame_acoes, text="PDFs em Lote", command=self.gerar_pdfs_em_lote).pack(side=tk.LEFT, padx=5)
+
+    def setup_painel_tab(self):
+        frame_topo = ttk.Frame(self.tab_painel)
+        frame_topo.pack(fill=tk.X, padx=10, pady=5)
+        self.label_total_painel = ttk.Label(frame_topo, text="Total de serviços: -", style="Header.TLabel")
+        self.label_total_painel.pack(side=tk.LEFT, padx=5)
+        ttk.Button(frame_topo, text="Atualizar", command=self.carregar_painel).pack(side=tk.RIGHT, padx=5)
+
+        frame_quadros = ttk.Frame(self.tab_painel)
+        frame_quadros.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        quadros = [('status', "Por Status", "Status"), ('bairro', "Por Bairro", "Bairro"),
+                   ('veiculo', "Por Veículo", "Placa"), ('mes', "Solicitações por Mês", "Mês"),
+                   ('mes_conclusao', "Conclusões por Mês", "Mês")]
+        self.tabelas_painel = {}
+        for posicao, (dimensao, titulo, cabecalho) in enumerate(quadros):
+            quadro = ttk.LabelFrame(frame_quadros, text=titulo)
+            quadro.grid(row=posicao // 3, column=posicao % 3, sticky="nsew", padx=5, pady=5)
+            tabela = ttk.Treeview(quadro, columns=("valor", "total"), show="headings", height=8)
+            tabela.heading("valor", text=cabecalho)
+            tabela.heading("total", text="Quantidade")
+            tabela.column("valor", width=180, anchor=tk.W)
+            tabela.column("total", width=90, anchor=tk.CENTER)
+            scrollbar = ttk.Scrollbar(quadro, orient=tk.VERTICAL, command=tabela.yview)
+            tabela.configure(yscrollcommand=scrollbar.set)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+            tabela.pack(fill=tk.BOTH, expand=True)
+            self.tabelas_painel[dimensao] = tabela
+        for coluna in range(3):
+            frame_quadros.columnconfigure(coluna, weight=1)
+        for linha in range(2):
+            frame_quadros.rowconfigure(linha, weight=1)
+
+        # Os totais vêm da tabela resumo_servicos, então podem ser relidos sempre que o painel é aberto
+        self.notebook.bind("<<NotebookTabChanged>>", self._aba_alterada, add="+")
+
+    def _aba_alterada(self, event=None):
+        if self.notebook.select() == str(self.tab_painel):
+            self.carregar_painel()
+
+    def carregar_painel(self):
+        self.tarefas.executar(self.db.obter_resumo, callback=self._exibir_painel)
+
+    def _exibir_painel(self, resumo):
+        total = sum(quantidade for _, quantidade in resumo.get('status', []))
+        self.label_total_painel.config(text=f"Total de serviços: {total}")
+        for dimensao, tabela in self.tabelas_painel.items():
+            tabela.delete(*tabela.get_children())
+            for valor, quantidade in resumo.get(dimensao, []):
+                if dimensao.startswith('mes'):
+                    # AAAA-MM -> MM/AAAA
+                    valor = f"{valor[5:7]}/{valor[:4]}"
+                tabela.insert("", "end", values=(valor, quantidade))
 
     def setup_cadastro_tab(self):
         main_frame = ttk.Frame(self.tab_cadastro)
@@ -319,11 +455,11 @@ class CRUDApp:
                 widget.config(state=state)
 
     def run_in_thread(self, target_func, callback, *args):
-        def threaded_func():
-            result = target_func(*args)
-            self.root.after(0, callback, result)
+        return self.tarefas.executar(target_func, *args, callback=callback)
 
-        threading.Thread(target=threaded_func).start()
+    def _erro_tarefa(self, erro):
+        self.mostrar_progresso(False)
+        messagebox.showerror("Erro", f"Erro ao executar a operação:\n{erro}")
 
     def mostrar_progresso(self, mostrar=True, texto="Processando..."):
         if mostrar:
@@ -337,54 +473,176 @@ class CRUDApp:
             self.progress_bar.pack_forget()
 
     def carregar_servicos(self):
-        for item in self.tabela.get_children():
-            self.tabela.delete(item)
+        if self.modo_rolagem_continua.get():
+            self.lista_virtual.recarregar(self.filtros, manter_posicao=True)
+            return
 
-        servicos, self.total_registros = self.db.listar_servicos(
-            filtros=self.filtros, pagina=self.pagina_atual, itens_por_pagina=self.itens_por_pagina
-        )
+        # Uma nova carga torna obsoleta a anterior, que é cancelada se ainda não tiver terminado
+        if self._tarefa_lista is not None:
+            self._tarefa_lista.cancelar()
+        self._tarefa_lista = self.tarefas.executar(
+            self.cache.listar_servicos_pagina, filtros=self.filtros, itens_por_pagina=self.itens_por_pagina,
+            token=self.token_pagina, ultima=self.ultima_pagina, callback=self._exibir_servicos)
+
+    @staticmethod
+    def _valores_linha(servico):
+        endereco = f"{servico.get('bairro', '')}, {servico.get('rua', '')}, {servico.get('numero', '')}"
+        return (servico['id'], servico['data_solicitacao_fmt'], servico['nome'], servico['cpf'], servico['telefone'], endereco,
+                servico['status'])
+
+    def _exibir_servicos(self, resultado):
+        servicos, self.total_registros, self.token_anterior, self.token_proximo = resultado
         total_paginas = max(1, (self.total_registros + self.itens_por_pagina - 1) // self.itens_por_pagina)
         self.label_paginacao.config(
             text=f"Página {self.pagina_atual} de {total_paginas} (Total: {self.total_registros} registros)")
+        self._sincronizar_tabela(servicos)
+        if not self._primeira_pagina_exibida:
+            self._primeira_pagina_exibida = True
+            self._concluir_inicializacao()
+
+    def _sincronizar_tabela(self, servicos):
+        """
+        Atualiza a tabela comparando os serviços com as linhas já exibidas (o item é o protocolo):
+        só insere, move, altera ou remove o que mudou, preservando seleção e rolagem
+        """
+        novos = [(str(servico['id']), self._valores_linha(servico)) for servico in servicos]
+        ids_novos = {item for item, _ in novos}
+
+        atuais = self.tabela.get_children()
+        removidos = [item for item in atuais if item not in ids_novos]
+        if removidos:
+            self.tabela.delete(*removidos)
+            atuais = self.tabela.get_children()
+
+        existentes = set(atuais)
+        for posicao, (item, valores) in enumerate(novos):
+            if item not in existentes:
+                self.tabela.insert("", posicao, iid=item, values=valores)
+                continue
+            self._atualizar_valores(item, valores)
+            if self.tabela.index(item) != posicao:
+                self.tabela.move(item, "", posicao)
+
+    def _atualizar_valores(self, item, valores):
+        # O Treeview devolve os valores como texto
+        if tuple(str(valor) for valor in self.tabela.item(item, "values")) != tuple(str(valor) for valor in valores):
+            self.tabela.item(item, values=valores)
+
+    def atualizar_linha(self, id_servico):
+        """Recarrega apenas a linha do serviço informado, se estiver na tela"""
+        self.tarefas.executar(self.cache.obter_servico, id_servico, callback=self._exibir_linha)
+
+    def _exibir_linha(self, servico):
+        if not servico:
+            self.carregar_servicos()
+        elif self.modo_rolagem_continua.get():
+            self.lista_virtual.atualizar_servico(servico)
+        elif self.tabela.exists(str(servico['id'])):
+            self._atualizar_valores(str(servico['id']), self._valores_linha(servico))
+
+    def alternar_rolagem_continua(self):
+        if self._tarefa_lista is not None:
+            self._tarefa_lista.cancelar()
+        if self.modo_rolagem_continua.get():
+            self.label_paginacao.config(text="Rolagem contínua")
+            self.lista_virtual.ativar()
+            self.lista_virtual.recarregar(self.filtros)
+        else:
+            self.lista_virtual.desativar()
+            self.ir_para_primeira_pagina()
 
-        for servico in servicos:
-            data = datetime.strptime(servico['data_solicitacao'], '%Y-%m-%d %H:%M:%S').strftime('%d/%m/%Y')
-            endereco = f"{servico.get('bairro', '')}, {servico.get('rua', '')}, {servico.get('numero', '')}"
-            self.tabela.insert("", "end",
-                               values=(servico['id'], data, servico['nome'], servico['cpf'], servico['telefone'],
-                                       endereco, servico['status']))
-
-    def aplicar_filtros(self):
-        self.filtros = {
+    def _ler_filtros(self):
+        filtros = {
             'nome': self.filtro_nome.get().strip(),
             'cpf': self.filtro_cpf.get().strip(),
             'status': self.filtro_status.get().strip(),
             'bairro': self.filtro_bairro.get().strip(),
             'rua': self.filtro_rua.get().strip()
         }
-        self.filtros = {k: v for k, v in self.filtros.items() if v}
-        self.pagina_atual = 1
-        self.carregar_servicos()
+        for campo, entrada in self.filtros_data.items():
+            filtros[campo] = entrada.get().strip()
+        filtros['incluir_arquivo'] = self.filtro_incluir_arquivo.get()
+        return {k: v for k, v in filtros.items() if v}
+
+    def _cancelar_filtro_agendado(self):
+        if self._filtro_agendado is not None:
+            self.root.after_cancel(self._filtro_agendado)
+            self._filtro_agendado = None
+
+    def agendar_filtros(self, event=None):
+        """
+        Aplica os filtros alguns milissegundos após a última tecla, para não consultar o banco a cada
+        caractere. Enter aplica imediatamente.
+        """
+        self._cancelar_filtro_agendado()
+        if event is not None and getattr(event, 'keysym', None) in ('Return', 'KP_Enter'):
+            self.aplicar_filtros()
+            return
+        self._filtro_agendado = self.root.after(self.atraso_filtro_ms, self._aplicar_filtros_digitados)
+
+    def _aplicar_filtros_digitados(self):
+        self._filtro_agendado = None
+        # Teclas que não alteram o texto (setas, Shift...) não devem refazer a consulta
+        if self._ler_filtros() != self.filtros:
+            self.aplicar_filtros()
+
+    def aplicar_filtros(self):
+        # A consulta anterior ainda em andamento é cancelada em carregar_servicos (ou descartada pela
+        # geração da lista virtual), então só o resultado dos filtros mais recentes é exibido
+        self._cancelar_filtro_agendado()
+        self.filtros = self._ler_filtros()
+        self.ir_para_primeira_pagina()
 
     def limpar_filtros(self):
+        self._cancelar_filtro_agendado()
         self.filtro_nome.delete(0, tk.END)
         self.filtro_cpf.delete(0, tk.END)
         self.filtro_status.set("")
         self.filtro_bairro.delete(0, tk.END)
         self.filtro_rua.delete(0, tk.END)
+        for entrada in self.filtros_data.values():
+            entrada.delete(0, tk.END)
+        self.filtro_incluir_arquivo.set(False)
         self.filtros = {}
+        self.ir_para_primeira_pagina()
+
+    def ir_para_primeira_pagina(self):
+        if self.modo_rolagem_continua.get():
+            self.lista_virtual.recarregar(self.filtros)
+            return
         self.pagina_atual = 1
+        self.token_pagina = None
+        self.ultima_pagina = False
         self.carregar_servicos()
 
     def mudar_pagina(self, pagina):
+        if self.modo_rolagem_continua.get():
+            return
         total_paginas = max(1, (self.total_registros + self.itens_por_pagina - 1) // self.itens_por_pagina)
-        self.pagina_atual = max(1, min(pagina, total_paginas))
+        pagina = max(1, min(pagina, total_paginas))
+        if pagina == self.pagina_atual:
+            return
+
+        # Navegação por cursor: só as páginas vizinhas, a primeira e a última são alcançáveis
+        if pagina == 1:
+            token, ultima = None, False
+        elif pagina == total_paginas:
+            token, ultima = None, True
+        elif pagina == self.pagina_atual + 1 and self.token_proximo:
+            token, ultima = self.token_proximo, False
+        elif pagina == self.pagina_atual - 1 and self.token_anterior:
+            token, ultima = self.token_anterior, False
+        else:
+            return
+
+        self.pagina_atual = pagina
+        self.token_pagina = token
+        self.ultima_pagina = ultima
         self.carregar_servicos()
 
     def alterar_itens_por_pagina(self, event=None):
         self.itens_por_pagina = int(self.cb_itens_por_pagina.get())
-        self.pagina_atual = 1
-        self.carregar_servicos()
+        self.ir_para_primeira_pagina()
 
     def _get_selected_id(self, action):
         item = self.tabela.selection()
@@ -411,10 +669,15 @@ class CRUDApp:
         servico_id = self._get_selected_id("excluir")
         if servico_id and messagebox.askyesno("Confirmar Exclusão",
                                               f"Tem certeza que deseja excluir o serviço {servico_id}?"):
-            self.db.excluir_servico(servico_id)
-            self.cache.clear()
-            self.carregar_servicos()
-            messagebox.showinfo("Sucesso", "Serviço excluído com sucesso!")
+            self.tarefas.executar(self.db.excluir_servico, servico_id, callback=self._excluir_servico_callback)
+
+    def _excluir_servico_callback(self, excluido):
+        if not excluido:
+            # excluir_servico só altera a tabela principal
+            messagebox.showerror("Erro", MENSAGEM_SOMENTE_LEITURA)
+            return
+        self.carregar_servicos()
+        messagebox.showinfo("Sucesso", "Serviço excluído com sucesso!")
 
     def _gerar_pdf_callback(self, result):
         self.mostrar_progresso(False)
@@ -437,6 +700,46 @@ class CRUDApp:
                     lambda: (self.export_manager.gerar_pdf(servico_id, caminho_arquivo), caminho_arquivo),
                     self._gerar_pdf_callback)
 
+    def _gerar_pdfs_em_lote_callback(self, resultado):
+        self.mostrar_progresso(False)
+        gerados = len(resultado['arquivos']) if not resultado['arquivo_mesclado'] else 'todos'
+        if resultado['falhas']:
+            detalhes = '\n'.join(f"Protocolo {id_servico}: {erro}" for id_servico, erro in resultado['falhas'][:10])
+            messagebox.showwarning("PDFs em Lote", f"Falha em {len(resultado['falhas'])} ordem(ns):\n{detalhes}")
+        elif resultado['arquivo_mesclado'] or resultado['arquivos']:
+            messagebox.showinfo("Sucesso", f"PDFs gerados: {gerados}")
+        else:
+            messagebox.showwarning("Aviso", "Nenhum serviço encontrado para gerar PDFs.")
+
+    def gerar_pdfs_em_lote(self):
+        # Com serviços selecionados usa a seleção; sem seleção, todos os serviços filtrados, após confirmação
+        selecao = self.tabela.selection()
+        ids = [self.tabela.item(item, "values")[0] for item in selecao] or None
+        if ids is None:
+            total = self.db.contar_servicos(self.filtros)
+            if not total:
+                messagebox.showwarning("Aviso", "Nenhum serviço encontrado para gerar PDFs.")
+                return
+            alcance = "filtrados" if self.filtros else "cadastrados, sem nenhum filtro aplicado"
+            if not messagebox.askyesno("PDFs em Lote",
+                                       f"Nenhum serviço selecionado. Gerar as ordens de todos os {total} serviços "
+                                       f"{alcance}?"):
+                return
+        if messagebox.askyesno("PDFs em Lote", "Juntar todas as ordens em um único PDF?"):
+            destino = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF", "*.pdf")],
+                                                   title="Salvar PDF")
+            mesclar = True
+        else:
+            destino = filedialog.askdirectory(title="Pasta para os PDFs")
+            mesclar = False
+        if destino:
+            self.mostrar_progresso(True, "Gerando PDFs...")
+            self.run_in_thread(
+                lambda: self.export_manager.gerar_pdfs_em_lote(
+                    destino, ids=ids, filtros=self.filtros, mesclar=mesclar,
+                    callback_progresso=lambda concluidos, total: self.atualizar_progresso(100.0 * concluidos / total)),
+                self._gerar_pdfs_em_lote_callback)
+
     def _visualizar_pdf_callback(self, success):
         self.mostrar_progresso(False)
         if not success:
@@ -463,12 +766,81 @@ class CRUDApp:
         if caminho_arquivo:
             self.mostrar_progresso(True, "Exportando para Excel...")
             self.run_in_thread(
-                lambda: (self.export_manager.exportar_excel(caminho_arquivo, self.filtros), caminho_arquivo),
+                lambda: (self.export_manager.exportar_excel(caminho_arquivo, self.filtros, streaming=True),
+                         caminho_arquivo),
                 self._exportar_excel_callback)
 
+    def atualizar_progresso(self, percentual):
+        # Chamado a partir da thread de trabalho: a atualização do widget é feita pelo loop do Tk
+        self.tarefas.agendar(self.progress_var.set, percentual)
+
+    def _importar_planilha_callback(self, resumo):
+        self.mostrar_progresso(False)
+        self.ir_para_primeira_pagina()
+        mensagem = f"Serviços importados: {resumo['inseridos']}"
+        if resumo['duplicados']:
+            linhas = ', '.join(str(linha) for linha, _ in resumo['duplicados'][:20])
+            mensagem += f"\nEndereços duplicados ignorados: {len(resumo['duplicados'])} (linhas {linhas})"
+        if resumo['erros']:
+            detalhes = '\n'.join(f"Linha {linha}: {erro}" for linha, erro in resumo['erros'][:10])
+            mensagem += f"\nLinhas com erro: {len(resumo['erros'])}\n{detalhes}"
+            messagebox.showwarning("Importação concluída com erros", mensagem)
+        else:
+            messagebox.showinfo("Importação concluída", mensagem)
+
+    def importar_planilha(self):
+        caminho_arquivo = filedialog.askopenfilename(filetypes=[("Planilhas", "*.xlsx *.csv"), ("Excel", "*.xlsx"),
+                                                                ("CSV", "*.csv")], title="Importar Planilha")
+        if caminho_arquivo:
+            self.mostrar_progresso(True, "Importando planilha...")
+            self.run_in_thread(
+                lambda: self.import_manager.importar(caminho_arquivo, callback_progresso=self.atualizar_progresso),
+                self._importar_planilha_callback)
+
+    def arquivar_servicos(self):
+        dias = simpledialog.askinteger(
+            "Arquivar Antigos", "Arquivar serviços concluídos ou cancelados há mais de quantos dias?",
+            initialvalue=365, minvalue=1, parent=self.root)
+        if dias:
+            self.mostrar_progresso(True, "Arquivando serviços...")
+            self.run_in_thread(lambda: self.db.arquivar_servicos(dias=dias), self._arquivar_servicos_callback)
+
+    def _arquivar_servicos_callback(self, arquivados):
+        self.mostrar_progresso(False)
+        messagebox.showinfo("Arquivamento", f"{arquivados} serviço(s) movido(s) para o arquivo.\n"
+                                            "Marque \"Incluir arquivados\" nos filtros para consultá-los.")
+        self.carregar_servicos()
+
+    def _exportar_dados_callback(self, result):
+        self.mostrar_progresso(False)
+        success, caminho_arquivo = result
+        if success:
+            messagebox.showinfo("Sucesso", f"Dados exportados com sucesso!\nSalvo em: {caminho_arquivo}")
+        else:
+            messagebox.showerror("Erro", "Erro ao exportar os dados.")
+
+    def exportar_dados(self):
+        caminho_arquivo = filedialog.asksaveasfilename(
+            defaultextension=".csv", filetypes=[("CSV", "*.csv"), ("CSV compactado", "*.csv.gz"),
+                                                ("Parquet", "*.parquet")])
+        if caminho_arquivo:
+            if caminho_arquivo.lower().endswith('.parquet'):
+                exportar = self.export_manager.exportar_parquet
+            else:
+                exportar = self.export_manager.exportar_csv
+            self.mostrar_progresso(True, "Exportando dados...")
+            self.run_in_thread(lambda: (exportar(caminho_arquivo, self.filtros), caminho_arquivo),
+                               self._exportar_dados_callback)
+
     def carregar_servico(self, id_servico):
-        servico = self.db.obter_servico(id_servico)
+        # Lê direto do banco, e não do cache: o formulário precisa da versão atual do serviço
+        self.tarefas.executar(self.db.obter_servico, id_servico, incluir_arquivo='incluir_arquivo' in self.filtros,
+                              callback=self._preencher_formulario)
+
+    def _preencher_formulario(self, servico):
         if servico:
+            # Guardado para que a gravação detecte alterações feitas por outros enquanto o formulário está aberto
+            self.servico_original = servico
             self.vars['id'].set(servico.get('id', ''))
             self.vars['cpf'].set(servico.get('cpf', ''))
             self.vars['nome'].set(servico.get('nome', ''))
@@ -495,12 +867,13 @@ class CRUDApp:
         if not self.validar_campos_obrigatorios():
             return
 
-        id_atual = self.vars['id'].get()
-        endereco_duplicado_id = self.db.verificar_endereco_duplicado(
+        self.tarefas.executar(
+            self.db.verificar_endereco_duplicado,
             self.vars['bairro'].get(), self.vars['rua'].get(), self.vars['numero'].get(),
-            self.vars['quadra'].get(), self.vars['lote'].get(), id_atual
-        )
+            self.vars['quadra'].get(), self.vars['lote'].get(), self.vars['id'].get(),
+            callback=self._confirmar_e_gravar_servico)
 
+    def _confirmar_e_gravar_servico(self, endereco_duplicado_id):
         if endereco_duplicado_id and not self.confirmar_duplicidade:
             if messagebox.askyesno("Endereço Duplicado",
                                    f"Endereço já cadastrado (Protocolo: {endereco_duplicado_id}). Continuar?"):
@@ -508,6 +881,7 @@ class CRUDApp:
             else:
                 return
 
+        id_atual = self.vars['id'].get()
         dados = {
             'cpf': self.vars['cpf'].get(), 'nome': self.vars['nome'].get(),
             'inscricao_municipal': self.vars['inscricao'].get() or None,
@@ -528,14 +902,37 @@ class CRUDApp:
             })
 
         if id_atual:
-            self.db.atualizar_servico(id_atual, dados)
-            messagebox.showinfo("Sucesso", "Serviço atualizado com sucesso!")
+            self.tarefas.executar(self.db.atualizar_servico, id_atual, dados, original=self.servico_original,
+                                  callback=lambda atualizado: self._servico_atualizado(atualizado, id_atual),
+                                  ao_erro=lambda erro: self._erro_atualizacao(erro, id_atual))
         else:
-            servico_id = self.db.inserir_servico(dados)
-            messagebox.showinfo("Sucesso", f"Serviço cadastrado com sucesso! Protocolo: {servico_id}")
+            self.tarefas.executar(
+                self.db.inserir_servico, dados,
+                callback=lambda servico_id: self._servico_gravado(
+                    f"Serviço cadastrado com sucesso! Protocolo: {servico_id}"))
+
+    def _servico_atualizado(self, atualizado, id_servico):
+        if atualizado:
+            self._servico_gravado("Serviço atualizado com sucesso!", id_servico)
+        else:
+            # atualizar_servico só altera a tabela principal
+            messagebox.showerror("Erro", MENSAGEM_SOMENTE_LEITURA)
 
-        self.cache.clear()
-        self.carregar_servicos()
+    def _erro_atualizacao(self, erro, id_servico):
+        if not isinstance(erro, ConflitoAtualizacao):
+            self._erro_tarefa(erro)
+            return
+        messagebox.showwarning("Serviço Alterado",
+                               "Este serviço foi alterado por outro usuário depois de aberto para edição.\n"
+                               "Os dados atuais serão recarregados; refaça as alterações.")
+        self.carregar_servico(id_servico)
+
+    def _servico_gravado(self, mensagem, id_atualizado=None):
+        messagebox.showinfo("Sucesso", mensagem)
+        if id_atualizado:
+            self.atualizar_linha(id_atualizado)
+        else:
+            self.carregar_servicos()
         self.notebook.select(self.tab_lista)
         self.limpar_formulario()
 
@@ -553,6 +950,7 @@ class CRUDApp:
         self.vars['status'].set("Pendente")
         self.confirmar_duplicidade = False
         self.endereco_duplicado_id = None
+        self.servico_original = None
         self.toggle_execucao_fields()
 
     def cancelar_edicao(self):
@@ -561,6 +959,13 @@ class CRUDApp:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sistema de Cadastro de Serviços")
+    parser.add_argument('--medir-inicializacao', action='store_true',
+                        help="Exibe o tempo de cada etapa da inicialização e encerra o programa")
+    parser.add_argument('--sem-aquecimento', action='store_true',
+                        help="Não carrega as dependências de exportação em segundo plano após abrir a janela")
+    args = parser.parse_args()
+
     root = tk.Tk()
-    app = CRUDApp(root)
+    app = CRUDApp(root, medir_inicializacao=args.medir_inicializacao, aquecer_exportacao=not args.sem_aquecimento)
     root.mainloop()
\ No newline at end of file
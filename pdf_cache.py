@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+
+class CachePDF:
+    """
+    Cache em disco dos PDFs gerados, indexado pelo protocolo e por um hash do conteúdo do serviço.
+    Quando o tamanho total passa do limite, os arquivos usados há mais tempo são removidos (LRU).
+    """
+    PREFIXO_TEMPORARIO = 'gerando-'
+
+    def __init__(self, pasta=None, limite_bytes=200 * 1024 * 1024):
+        self.pasta = pasta or os.path.join(tempfile.gettempdir(), 'crud_services_pdf')
+        self.limite_bytes = limite_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.pasta, exist_ok=True)
+
+    @staticmethod
+    def _hash_servico(servico):
+        conteudo = json.dumps(servico, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()[:20]
+
+    def _caminho(self, servico):
+        return os.path.join(self.pasta, f"{servico['id']}_{self._hash_servico(servico)}.pdf")
+
+    def obter(self, servico, gerar):
+        """
+        Retorna o caminho do PDF em cache para o serviço, gerando-o com gerar(servico, caminho)
+        se ainda não existir uma versão para o conteúdo atual do serviço
+        """
+        caminho = self._caminho(servico)
+        if os.path.exists(caminho):
+            # Atualiza a data de acesso usada na política LRU
+            os.utime(caminho)
+            return caminho
+
+        fd, caminho_temporario = tempfile.mkstemp(prefix=self.PREFIXO_TEMPORARIO, suffix='.pdf', dir=self.pasta)
+        os.close(fd)
+        try:
+            gerar(servico, caminho_temporario)
+            # Versões anteriores do mesmo serviço não serão mais usadas
+            self.invalidar(servico['id'])
+            os.replace(caminho_temporario, caminho)
+        except Exception:
+            os.remove(caminho_temporario)
+            raise
+        self._remover_excedente()
+        return caminho
+
+    def invalidar(self, id_servico):
+        """Remove do cache todas as versões do PDF do serviço"""
+        prefixo = f"{id_servico}_"
+        with self._lock:
+            for nome in os.listdir(self.pasta):
+                if nome.startswith(prefixo):
+                    try:
+                        os.remove(os.path.join(self.pasta, nome))
+                    except OSError:
+                        pass
+
+    def limpar(self):
+        """Remove todos os PDFs do cache"""
+        with self._lock:
+            for nome in os.listdir(self.pasta):
+                try:
+                    os.remove(os.path.join(self.pasta, nome))
+                except OSError:
+                    pass
+
+    def _remover_excedente(self):
+        with self._lock:
+            arquivos = []
+            for entrada in os.scandir(self.pasta):
+                if entrada.is_file() and not entrada.name.startswith(self.PREFIXO_TEMPORARIO):
+                    info = entrada.stat()
+                    arquivos.append((info.st_mtime, info.st_size, entrada.path))
+            total = sum(tamanho for _, tamanho, _ in arquivos)
+            for _, tamanho, caminho in sorted(arquivos):
+                if total <= self.limite_bytes:
+                    break
+                try:
+                    os.remove(caminho)
+                    total -= tamanho
+                except OSError:
+                    pass
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError, wait
+
+
+class Tarefa:
+    """
+    Representa uma ação enviada ao ExecutorTarefas.
+    Depois de cancelada, o callback da tarefa nunca é chamado, mesmo que ela já esteja em execução.
+    """
+    def __init__(self):
+        self.futuro = None
+        self._cancelada = threading.Event()
+
+    @property
+    def cancelada(self):
+        return self._cancelada.is_set()
+
+    def cancelar(self):
+        self._cancelada.set()
+        if self.futuro is not None:
+            self.futuro.cancel()
+
+    def concluida(self):
+        return self.futuro is not None and self.futuro.done()
+
+
+class ExecutorTarefas:
+    """
+    Executa as operações de banco e de exportação em um pool fixo de threads e entrega
+    os resultados (ou erros) ao loop do Tkinter, de onde os widgets podem ser atualizados
+    """
+    def __init__(self, root, max_workers=4, intervalo_ms=30, ao_erro=None):
+        self.root = root
+        self.intervalo_ms = intervalo_ms
+        self.ao_erro = ao_erro
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tarefa')
+        self._fila = queue.Queue()
+        # Tarefas enviadas e ainda não concluídas, aguardadas no encerramento
+        self._em_andamento = set()
+        self._ativo = True
+        self.root.after(self.intervalo_ms, self._processar_fila)
+
+    def executar(self, funcao, *args, callback=None, ao_erro=None, **kwargs):
+        """
+        Executa funcao(*args, **kwargs) em segundo plano
+        callback(resultado) ou ao_erro(excecao) são chamados na thread do Tkinter
+        Retorna a Tarefa, que pode ser cancelada
+        """
+        tarefa = Tarefa()
+        tarefa.futuro = self._executor.submit(funcao, *args, **kwargs)
+        self._em_andamento.add(tarefa.futuro)
+        tarefa.futuro.add_done_callback(lambda futuro: self._concluir(futuro, tarefa, callback, ao_erro))
+        return tarefa
+
+    def _concluir(self, futuro, tarefa, callback, ao_erro):
+        self._em_andamento.discard(futuro)
+        self._fila.put((tarefa, callback, ao_erro))
+
+    def agendar(self, funcao, *args):
+        """Agenda funcao(*args) para ser executada na thread do Tkinter (seguro a partir de qualquer thread)"""
+        self._fila.put((None, lambda _: funcao(*args), None))
+
+    def _processar_fila(self):
+        try:
+            while True:
+                try:
+                    tarefa, callback, ao_erro = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                self._entregar(tarefa, callback, ao_erro)
+        finally:
+            # Reagenda mesmo que algum callback tenha falhado, para não travar as próximas tarefas
+            if self._ativo:
+                self.root.after(self.intervalo_ms, self._processar_fila)
+
+    def _entregar(self, tarefa, callback, ao_erro):
+        if tarefa is None:
+            callback(None)
+            return
+        if tarefa.cancelada:
+            return
+        try:
+            resultado = tarefa.futuro.result()
+        except CancelledError:
+            return
+        except Exception as e:
+            tratador = ao_erro or self.ao_erro
+            if tratador:
+                tratador(e)
+            else:
+                print(f"Erro em tarefa de segundo plano: {e}")
+            return
+        if callback:
+            callback(resultado)
+
+    def encerrar(self, timeout=2.0):
+        """
+        Cancela as tarefas que ainda não começaram e espera até `timeout` segundos pelas que estão
+        em execução, para que não usem o banco depois de fechado; retorna True se todas terminaram
+        """
+        self._ativo = False
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        _, pendentes = wait(list(self._em_andamento), timeout=timeout)
+        return not pendentes